@@ -0,0 +1,73 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from typing import Any, Dict, Optional
+
+# Same secret the Node backend signs its HS256 tokens with (backend/middlewares/auth.js).
+# Only needed where the AI service answers without asking the backend, e.g. the precomputed forecast store.
+JWT_SECRET = os.getenv("JWT_SECRET")
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def sign_token(claims: Dict[str, Any], secret: Optional[str] = None, ttl_seconds: int = 3600) -> str:
+    """HS256 JWT in the backend's format, for tools that act as a user (e.g. the stock load generator)."""
+    secret = secret or JWT_SECRET
+    if not secret:
+        raise ValueError("JWT_SECRET is required to sign tokens.")
+    now = int(time.time())
+    header_b64 = _b64url_encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+    payload_b64 = _b64url_encode(json.dumps({"iat": now, "exp": now + ttl_seconds, **claims}, separators=(",", ":")).encode())
+    signature = hmac.new(secret.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+    return f"{header_b64}.{payload_b64}.{_b64url_encode(signature)}"
+
+
+def bearer_header(token: str) -> str:
+    """Authorization header value for a JWT given bare or already as "Bearer <JWT>" (the scheme is never doubled)."""
+    token = token.strip()
+    if token[:7].lower() == "bearer ":
+        token = token[7:].strip()
+    return f"Bearer {token}"
+
+
+def verify_bearer_token(auth_token: str) -> Optional[Dict[str, Any]]:
+    """Returns the token's claims if it is a valid, unexpired HS256 JWT signed with JWT_SECRET, else None."""
+    if not JWT_SECRET or not auth_token:
+        return None
+    token = auth_token.split(" ", 1)[1] if auth_token.startswith("Bearer ") else auth_token
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64url_decode(header_b64))
+        if header.get("alg") != "HS256":
+            return None
+        expected = hmac.new(JWT_SECRET.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+            return None
+        claims = json.loads(_b64url_decode(payload_b64))
+    except (ValueError, TypeError):
+        return None
+
+    if "exp" in claims and time.time() >= float(claims["exp"]):
+        return None
+    return claims
+
+
+def can_read_centre(claims: Optional[Dict[str, Any]], centre_id: Optional[str]) -> bool:
+    """Mirrors the /daily route: authority reads any centre, vacc_centre only its own."""
+    if not claims:
+        return False
+    role = claims.get("role")
+    if role == "authority":
+        return True
+    if role == "vacc_centre":
+        return centre_id is not None and claims.get("vc_id") == centre_id
+    return False
@@ -0,0 +1,161 @@
+import os
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from cache_utils import LRUCache, SingleFlight
+from metrics import stage
+
+# Base URL of the Node backend that owns vaccine_log
+BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000")
+
+# Connection pool / timeout settings for the shared client
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "30"))
+
+# Short-lived cache of /daily responses; the backend re-aggregates vaccine_log on every call
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "60"))
+HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("HISTORY_CACHE_MAX_ENTRIES", "1024"))
+
+# Maps the forecast metric to the field of the /daily aggregate it is built from
+METRIC_FIELDS = {"used": "total_dose_used", "wasted": "total_dose_wasted"}
+
+
+def create_backend_client() -> httpx.AsyncClient:
+    """One keep-alive connection pool to the Node backend, shared by every request in the process."""
+    return httpx.AsyncClient(
+        base_url=BACKEND_BASE_URL,
+        limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+            keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(BACKEND_READ_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+    )
+
+
+_backend_client: Optional[httpx.AsyncClient] = None
+
+
+def get_backend_client() -> httpx.AsyncClient:
+    """Returns the app-scoped client (opened in the FastAPI lifespan, or lazily outside of it)."""
+    global _backend_client
+    if _backend_client is None or _backend_client.is_closed:
+        _backend_client = create_backend_client()
+    return _backend_client
+
+
+async def close_backend_client() -> None:
+    global _backend_client
+    if _backend_client is not None:
+        await _backend_client.aclose()
+        _backend_client = None
+
+
+async def fetch_daily_payload(
+    centre_vaccine_id: str,
+    auth_token: str,
+    client: Optional[httpx.AsyncClient] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Fetches the raw /daily response (centre_vaccine_id, centre_id, vaccine_name, daily)."""
+    client = client or get_backend_client()
+
+    # URL for the external historical data API (relative to the client's base_url)
+    external_api_url = f"/api/staff/centre_vaccine/{centre_vaccine_id}/daily"
+
+    headers = {
+        "Authorization": auth_token, # Use the token passed in the request body
+        "Accept": "application/json"
+    }
+
+    try:
+        with stage("backend_fetch"):
+            if timeout is None:
+                response = await client.get(external_api_url, headers=headers)
+            else:
+                response = await client.get(external_api_url, headers=headers, timeout=timeout)
+            response.raise_for_status() # Raises an exception for 4xx/5xx status codes
+            return response.json()
+    except httpx.HTTPError as e:
+        # Catch errors from the external service call
+        print(f"External API Error: {e}")
+        status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else 502
+        detail_message = f"Failed to fetch data from the external historical API. Status: {status_code}. Check token/permissions if {status_code} is 401/403."
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail_message
+        )
+
+
+async def fetch_daily_usage(
+    centre_vaccine_id: str,
+    auth_token: str,
+    client: Optional[httpx.AsyncClient] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Fetches the /daily aggregate for one centre_vaccine_id.
+    Each record carries both total_dose_used and total_dose_wasted, so one fetch serves both forecasts.
+    """
+    external_data = await fetch_daily_payload(centre_vaccine_id, auth_token, client=client, timeout=timeout)
+
+    daily_records = external_data.get("daily", [])
+    if not daily_records:
+        raise HTTPException(
+            status_code=404,
+            detail="External API returned no historical usage data for this center/vaccine ID."
+        )
+    return daily_records
+
+
+def daily_records_to_columns(daily_records: List[Dict[str, Any]], metric: str) -> Tuple[List[Any], List[float]]:
+    """Picks one metric out of the /daily records as the (dates, values) columns prepare_columns expects."""
+    field = METRIC_FIELDS[metric]
+    dates = [record.get("date") for record in daily_records]
+    values = [float(record.get(field, 0) or 0) for record in daily_records]
+    return dates, values
+
+
+# --- Cached + coalesced history fetch ---
+
+history_cache = LRUCache(max_entries=HISTORY_CACHE_MAX_ENTRIES, ttl_seconds=HISTORY_CACHE_TTL_SECONDS)
+_history_flights = SingleFlight()
+
+
+def _history_key(centre_vaccine_id: str, auth_token: str) -> Tuple[str, str]:
+    # Scoped by a hash of the whole token: the backend decides who may read which centre,
+    # so a cached copy is only ever served back to the exact token it was fetched with.
+    scope = hashlib.sha256(auth_token.encode()).hexdigest()[:32]
+    return (centre_vaccine_id, scope)
+
+
+async def fetch_daily_usage_cached(centre_vaccine_id: str, auth_token: str) -> List[Dict[str, Any]]:
+    """
+    fetch_daily_usage behind a TTL cache and single-flight: N concurrent identical misses
+    make exactly one upstream call. Errors are not cached.
+    """
+    key = _history_key(centre_vaccine_id, auth_token)
+    cached = history_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def load() -> List[Dict[str, Any]]:
+        daily_records = await fetch_daily_usage(centre_vaccine_id, auth_token)
+        history_cache.set(key, daily_records)
+        return daily_records
+
+    return await _history_flights.do(key, load)
+
+
+def history_cache_stats() -> Dict[str, Any]:
+    stats = history_cache.stats()
+    flights = _history_flights.stats()
+    stats["upstream_calls"] = flights["calls"]
+    stats["coalesced"] = flights["coalesced"]
+    return stats
@@ -0,0 +1,90 @@
+"""
+Compares a fresh httpx.AsyncClient per request (the old forecast handlers) against the
+shared keep-alive client from backend_client.py, fetching /daily from a local stub backend.
+
+    python benchmarks/bench_backend_client.py --requests 2000 --concurrency 50
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import backend_client  # noqa: E402
+from stub_backend import run_stub_backend  # noqa: E402
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+async def run_scenario(name, fetch, n_requests, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with limit:
+            t0 = time.perf_counter()
+            await fetch(f"cv_{i % 64}")
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(n_requests)])
+    elapsed = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "throughput_rps": round(n_requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+async def main(args):
+    with run_stub_backend(days=args.days, latency_ms=args.latency_ms) as base_url:
+        backend_client.BACKEND_BASE_URL = base_url
+
+        async def per_request_client(cv_id):
+            # What the handlers did before: new client, new TCP connection, no keep-alive
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                await backend_client.fetch_daily_usage(cv_id, "Bearer stub", client=client)
+
+        shared = backend_client.create_backend_client()
+
+        async def pooled_client(cv_id):
+            await backend_client.fetch_daily_usage(cv_id, "Bearer stub", client=shared)
+
+        results = [
+            await run_scenario("per_request_client", per_request_client, args.requests, args.concurrency),
+            await run_scenario("pooled_client", pooled_client, args.requests, args.concurrency),
+        ]
+        await shared.aclose()
+
+    old, new = results
+    summary = {
+        "results": results,
+        "p50_reduction_pct": round(100 * (1 - new["p50_ms"] / old["p50_ms"]), 1) if old["p50_ms"] else 0.0,
+        "p99_reduction_pct": round(100 * (1 - new["p99_ms"] / old["p99_ms"]), 1) if old["p99_ms"] else 0.0,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
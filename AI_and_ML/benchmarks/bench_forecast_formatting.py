@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: the old iterrows-based forecast formatting vs forecasting.format_forecast,
+on synthetic Prophet-shaped frames (ds, yhat, yhat_lower, yhat_upper). No fitting involved.
+
+    python benchmarks/bench_forecast_formatting.py --horizons 30 365 3650 36500 --repeat 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from forecasting import format_forecast  # noqa: E402
+
+
+def legacy_format(future_forecast, n_days):
+    """The per-row loop run_prophet_model used before format_forecast."""
+    results = []
+    total_predicted = 0.0
+
+    for _, row in future_forecast.iterrows():
+        predicted_val = max(0.0, round(row['yhat'], 2))
+
+        results.append({
+            "date": row['ds'].strftime('%Y-%m-%d'),
+            "predicted_usage": predicted_val,
+            "lower_bound": max(0.0, round(row['yhat_lower'], 2)),
+            "upper_bound": max(0.0, round(row['yhat_upper'], 2))
+        })
+        total_predicted += predicted_val
+
+    return {
+        "forecast_total": round(total_predicted, 2),
+        "days_forecasted": n_days,
+        "daily_forecast": results
+    }
+
+
+def synthetic_forecast(n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    yhat = 50 + 30 * np.sin(np.arange(n_days) * 2 * np.pi / 7) + rng.normal(0, 20, n_days)
+    spread = rng.uniform(5, 25, n_days)
+    return pd.DataFrame({
+        "ds": pd.date_range("2025-01-01", periods=n_days, freq="D"),
+        "yhat": yhat,
+        "yhat_lower": yhat - spread,
+        "yhat_upper": yhat + spread,
+    })
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings) * 1000
+
+
+def main(args):
+    rows = []
+    for n_days in args.horizons:
+        frame = synthetic_forecast(n_days)
+        old = legacy_format(frame, n_days)
+        new = format_forecast(frame, n_days)
+
+        # Same payload up to float summation order in the total
+        assert old["daily_forecast"] == new["daily_forecast"], f"row mismatch at horizon {n_days}"
+        assert abs(old["forecast_total"] - new["forecast_total"]) <= 0.01 * max(1, n_days / 1000)
+
+        old_ms = best_of(lambda: legacy_format(frame, n_days), args.repeat)
+        new_ms = best_of(lambda: format_forecast(frame, n_days), args.repeat)
+        rows.append({
+            "horizon_days": n_days,
+            "iterrows_ms": round(old_ms, 3),
+            "vectorized_ms": round(new_ms, 3),
+            "speedup": round(old_ms / new_ms, 1) if new_ms else None,
+        })
+
+    print(json.dumps({"benchmark": "forecast_formatting", "repeat": args.repeat, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--horizons", type=int, nargs="+", default=[30, 365, 3650, 36500])
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,376 @@
+"""
+End-to-end load test of the AI service with everything external faked: Gemini (fake_gemini.py),
+Pinecone (the local vector store, in a temporary directory) and the Node backend (stub_backend.py).
+
+The service runs in a child process (real uvicorn, routers, caches and forecast pool) and this
+process only generates load. Every scenario runs at each --concurrency level and reports throughput,
+error rate, p50/p95/p99 latency (and time to first byte for streamed responses), plus the mean
+server-side stage times scraped from /metrics. Results are JSON; --compare flags regressions
+against an earlier run and exits non-zero:
+
+    python benchmarks/bench_service.py --output bench.json
+    python benchmarks/bench_service.py --scenarios chat faq_chat --concurrency 1 8 32 --compare bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import httpx  # noqa: E402
+
+from stub_backend import free_port, run_stub_backend, synthetic_daily  # noqa: E402
+
+# Nothing from the service is imported here: the service process must set its environment first.
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+# --- Scenarios ---
+# Each builds the i-th request: (path, JSON body, streamed response?)
+
+HISTORY = [
+    {"role": "user", "content": "Which vaccines does my baby need?"},
+    {"role": "model", "content": "BCG, OPV, Pentavalent, PCV, IPV, MR and TT, following the EPI schedule."},
+]
+
+FAQ_QUESTIONS = [
+    "How do I register if I don't have a National ID (NID) card?",
+    "What should I do if I miss my scheduled appointment?",
+    "Are the vaccines free, or do I need to pay?",
+    "Can I change my vaccination center after booking an appointment?",
+    "I lost my digital vaccine card, can I get it again?",
+    "Do I have to pay for vaccines?",
+    "What are the side effects of the measles vaccine for a 9 month old?",
+    "Can a foreigner living in Dhaka use this system?",
+]
+
+
+def vaccine(name: str) -> dict:
+    return {
+        "vaccine_name": name,
+        "full_name": f"{name} vaccine",
+        "category": "Government EPI (Mandatory)",
+        "details": f"{name} is given as part of the national schedule. " * 4,
+        "preservation_guidelines": f"Store {name} between +2°C and +8°C, protect from light, do not freeze.",
+    }
+
+
+def posted_history(seed: str, days: int) -> list:
+    return [{"date": r["date"], "amphules_used": r["total_dose_used"]} for r in synthetic_daily(seed, days)]
+
+
+def build_scenarios(series: int) -> dict:
+    # Histories are cycled over `series` distinct series, so later passes hit the fitted-model cache
+    short = [posted_history(f"bench_short_{k}", 21) for k in range(series)]
+    long = [posted_history(f"bench_long_{k}", 120) for k in range(series)]
+    token = "Bearer bench"
+    return {
+        "chat": lambda i: ("/chat", {"message": f"How do I store vaccine {i % 50}?", "history": HISTORY}, False),
+        "chat_stream": lambda i: ("/chat/stream", {"message": f"How do I store vaccine {i % 50}?", "history": HISTORY}, True),
+        "center_chat": lambda i: ("/center_chat", {"message": f"Fridge log rules for batch {i % 50}?", "history": HISTORY}, False),
+        "faq_chat": lambda i: ("/faq_chat", {"message": FAQ_QUESTIONS[i % len(FAQ_QUESTIONS)]}, False),
+        "store_vaccine": lambda i: ("/store-vaccine", vaccine(f"BENCH{i}"), False),
+        "store_vaccines_bulk": lambda i: ("/store-vaccines/bulk", [vaccine(f"BULK{i}_{k}") for k in range(50)], False),
+        "forecast_holt_winters": lambda i: (
+            "/forecast", {"history": short[i % series], "days_to_forecast": 30, "model": "holt_winters"}, False
+        ),
+        "forecast_prophet": lambda i: (
+            "/forecast", {"history": long[i % series], "days_to_forecast": 30, "model": "prophet"}, False
+        ),
+        "forecast_demand": lambda i: (
+            "/forecast_demand", {"centre_vaccine_id": f"bench_cv_{i % series}", "days_to_forecast": 30, "auth_token": token}, False
+        ),
+        "forecast_usage": lambda i: (
+            "/forecast_usage", {"centre_vaccine_id": f"bench_cv_{i % series}", "days_to_forecast": 30, "auth_token": token}, False
+        ),
+        "forecast_batch": lambda i: (
+            "/forecast_batch",
+            {"centre_vaccine_ids": [f"bench_cv_{(i + k) % series}" for k in range(8)], "days_to_forecast": 30, "auth_token": token},
+            True,
+        ),
+    }
+
+
+# --- Service process ---
+
+def serve(args):
+    """Child process: fakes installed, stub backend on a thread, the real app on uvicorn."""
+    import uvicorn
+    import fake_gemini
+
+    with tempfile.TemporaryDirectory(prefix="ai-bench-") as tmp, \
+            run_stub_backend(days=args.days, latency_ms=args.backend_latency_ms) as backend_url:
+        os.environ.update({
+            "GOOGLE_API_KEY": "bench",
+            "VECTOR_STORE": "local",
+            "LOCAL_VECTOR_STORE_PATH": os.path.join(tmp, "vector_store"),
+            "EMBEDDING_CACHE_PATH": os.path.join(tmp, "embedding_cache.sqlite3"),
+            "VACCINE_CHUNK_LEDGER_PATH": os.path.join(tmp, "vaccine_chunks.sqlite3"),
+            "FORECAST_STORE_PATH": os.path.join(tmp, "forecasts.sqlite3"),
+            "CHAT_SESSION_STORE": "memory",
+            "BACKEND_BASE_URL": backend_url,
+            "FORECAST_WORKERS": str(args.forecast_workers),
+        })
+        fake_gemini.install(
+            latency_ms=args.llm_latency_ms,
+            jitter_ms=args.llm_jitter_ms,
+            chunk_latency_ms=args.chunk_latency_ms,
+            tool_rounds=args.tool_rounds,
+            calls_per_round=args.calls_per_round,
+            embed_latency_ms=args.embed_latency_ms,
+        )
+        import AI_and_ML  # after the environment is set: the modules read it at import
+
+        uvicorn.run(AI_and_ML.app, host="127.0.0.1", port=args.serve, log_level="warning")
+
+
+SERVE_OPTIONS = (
+    "days", "backend_latency_ms", "forecast_workers", "llm_latency_ms", "llm_jitter_ms",
+    "chunk_latency_ms", "tool_rounds", "calls_per_round", "embed_latency_ms",
+)
+
+
+def start_service(args):
+    port = free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", str(port)]
+    for option in SERVE_OPTIONS:
+        cmd += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    # The service prints a line per tool call; keep its stdout out of the report unless asked for
+    stdout = None if args.service_output else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(BENCH_DIR), stdout=stdout)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Service exited during startup (code {proc.returncode}).")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Service did not start in time.")
+
+
+# --- Load generation ---
+
+_STAGE_SAMPLE = re.compile(r'^ai_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.M)
+
+
+async def stage_totals(client: httpx.AsyncClient) -> dict:
+    totals = {}
+    for kind, stage, value in _STAGE_SAMPLE.findall((await client.get("/metrics")).text):
+        totals.setdefault(stage, {"sum": 0.0, "count": 0.0})[kind] = float(value)
+    return totals
+
+
+def stage_deltas(before: dict, after: dict, requests: int) -> dict:
+    """Mean server-side time per stage call and calls per request, over one load level."""
+    result = {}
+    for stage, totals in after.items():
+        prior = before.get(stage, {"sum": 0.0, "count": 0.0})
+        count = totals["count"] - prior["count"]
+        if count:
+            result[stage] = {
+                "mean_ms": round(1000 * (totals["sum"] - prior["sum"]) / count, 2),
+                "per_request": round(count / requests, 2),
+            }
+    return result
+
+
+async def send(client: httpx.AsyncClient, path: str, body, streamed: bool):
+    """Returns (ok, latency_ms, ttfb_ms)."""
+    t0 = time.perf_counter()
+    if not streamed:
+        response = await client.post(path, json=body)
+        return response.is_success, (time.perf_counter() - t0) * 1000, None
+
+    ttfb, ok = None, True
+    async with client.stream("POST", path, json=body) as response:
+        ok = response.is_success
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = (time.perf_counter() - t0) * 1000
+            if line.startswith("event: error") or '"status": "error"' in line:
+                ok = False
+    return ok, (time.perf_counter() - t0) * 1000, ttfb
+
+
+async def run_level(client, name, build, n_requests, concurrency, offset):
+    limit = asyncio.Semaphore(concurrency)
+    latencies, ttfbs = [], []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        path, body, streamed = build(offset + i)
+        async with limit:
+            try:
+                ok, latency, ttfb = await send(client, path, body, streamed)
+            except httpx.HTTPError:
+                errors += 1
+                return
+        if not ok:
+            errors += 1
+        latencies.append(latency)
+        if ttfb is not None:
+            ttfbs.append(ttfb)
+
+    before = await stage_totals(client)
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(n_requests)])
+    elapsed = time.perf_counter() - started
+    after = await stage_totals(client)
+
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "error_rate": round(errors / n_requests, 4),
+        "throughput_rps": round(n_requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "stages": stage_deltas(before, after, n_requests),
+    }
+    if ttfbs:
+        result["ttfb_p50_ms"] = round(percentile(ttfbs, 50), 2)
+        result["ttfb_p99_ms"] = round(percentile(ttfbs, 99), 2)
+    return result
+
+
+def compare(baseline: dict, current: dict, threshold_pct: float) -> list:
+    """Per scenario and concurrency: latency percentiles and throughput that got worse by more than threshold_pct."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        checks = [(field, result[field], old[field]) for field in ("p50_ms", "p95_ms", "p99_ms") if old[field]]
+        # Throughput regresses when it drops, so compare it inverted
+        if result["throughput_rps"]:
+            checks.append(("throughput_rps", 1 / result["throughput_rps"], 1 / old["throughput_rps"]))
+        for field, new_value, old_value in checks:
+            change = 100 * (new_value / old_value - 1)
+            if change > threshold_pct:
+                regressions.append({
+                    "scenario": result["scenario"], "concurrency": result["concurrency"], "metric": field,
+                    "baseline": old[field], "current": result[field], "worse_by_pct": round(change, 1),
+                })
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    scenarios = build_scenarios(args.series)
+    unknown = set(args.scenarios) - set(scenarios)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios {sorted(unknown)}; available: {sorted(scenarios)}")
+
+    proc, base_url = start_service(args)
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            offset = 0
+            for name in args.scenarios:
+                build = scenarios[name]
+                # Warm-up: first fits, first embeddings, connection setup; not measured
+                await run_level(client, name, build, args.warmup, 1, offset)
+                offset += args.warmup
+                for concurrency in args.concurrency:
+                    result = await run_level(client, name, build, args.requests, concurrency, offset)
+                    offset += args.requests
+                    results.append(result)
+                    print(
+                        f"{name:<24} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                        f"p50 {result['p50_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  errors {result['errors']}",
+                        file=sys.stderr,
+                    )
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("serve", "output", "compare", "service_output")},
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(json.load(f), report, args.threshold_pct)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(build_scenarios(1)))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--series", type=int, default=16, help="Distinct histories / centre_vaccine_ids per forecast scenario")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument("--compare", help="Earlier JSON report to check for regressions")
+    parser.add_argument("--threshold-pct", type=float, default=10.0)
+    # Fakes and service settings (forwarded to the service process)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--chunk-latency-ms", type=float, default=20.0)
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--calls-per-round", type=int, default=1)
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--backend-latency-ms", type=float, default=20.0)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--forecast-workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--service-output", action="store_true", help="Show the service's stdout")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+    else:
+        asyncio.run(main(args))
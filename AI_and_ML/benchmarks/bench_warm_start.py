@@ -0,0 +1,84 @@
+"""
+Nightly-refresh simulation for Prophet warm-starting.
+
+For each synthetic series: fit on a 100-day window, slide the window forward by --new-days
+(what the backend's rolling /daily aggregate does overnight), then refit both cold and
+warm-started from the previous parameters. Reports fit time and forecast drift between the two.
+
+    python benchmarks/bench_warm_start.py --series 50 --new-days 1 --horizon 30
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import forecasting  # noqa: E402
+from stub_backend import synthetic_daily  # noqa: E402
+
+
+def history_frame(records):
+    return forecasting.prepare_history([
+        {"date": r["date"], "amphules_used": r["total_dose_used"]} for r in records
+    ])
+
+
+def timed_fit(df, settings, series_key):
+    t0 = time.perf_counter()
+    m = forecasting.fit_prophet(df, settings, series_key)
+    return m, (time.perf_counter() - t0) * 1000
+
+
+def main(args):
+    forecasting.FORECAST_WARM_START = True  # measured regardless of the service default
+    forecasting.FORECAST_WARM_START_MAX_NEW_DAYS = max(forecasting.FORECAST_WARM_START_MAX_NEW_DAYS, args.new_days)
+    end = date.today()
+
+    cold_ms, warm_ms, drift_pct = [], [], []
+    for i in range(args.series):
+        series_key = f"bench_{i}:used"
+        records = synthetic_daily(series_key, args.days + args.new_days, end=end)
+        yesterday = history_frame(records[:args.days])
+        today = history_frame(records[args.new_days:])
+        settings = forecasting.model_settings(today)
+
+        # Seed the warm-start store the way the previous night's run would have
+        timed_fit(yesterday, settings, series_key)
+
+        cold, t_cold = timed_fit(today, settings, None)
+        warm, t_warm = timed_fit(today, settings, series_key)
+
+        future = cold.make_future_dataframe(periods=args.horizon, freq='D')
+        yhat_cold = cold.predict(future)['yhat'].to_numpy()[-args.horizon:]
+        yhat_warm = warm.predict(future)['yhat'].to_numpy()[-args.horizon:]
+        drift = np.abs(yhat_warm - yhat_cold).mean() / max(np.abs(yhat_cold).mean(), 1e-9)
+
+        cold_ms.append(t_cold)
+        warm_ms.append(t_warm)
+        drift_pct.append(100 * drift)
+
+    print(json.dumps({
+        "benchmark": "prophet_warm_start",
+        "series": args.series,
+        "history_days": args.days,
+        "new_days": args.new_days,
+        "cold_fit_ms": {"mean": round(float(np.mean(cold_ms)), 1), "p50": round(float(np.median(cold_ms)), 1)},
+        "warm_fit_ms": {"mean": round(float(np.mean(warm_ms)), 1), "p50": round(float(np.median(warm_ms)), 1)},
+        "speedup": round(float(np.sum(cold_ms) / np.sum(warm_ms)), 2),
+        "forecast_drift_pct": {"mean": round(float(np.mean(drift_pct)), 3), "max": round(float(np.max(drift_pct)), 3)},
+        "fit_counters": dict(forecasting.fit_counters),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--new-days", type=int, default=1)
+    parser.add_argument("--horizon", type=int, default=30)
+    main(parser.parse_args())
@@ -0,0 +1,186 @@
+"""
+Deterministic stand-ins for the google.generativeai calls the service makes, so chat and RAG
+endpoints can be benchmarked offline:
+
+- FakeGenerativeModel / FakeChatSession: send_message() sleeps like a Gemini turn, answers with
+  function calls for the first `tool_rounds` turns of a chat (when the persona has tools), then
+  with text; stream=True yields the answer in chunks.
+- fake_embed_content: hash-seeded 768-d vectors, with a per-call latency.
+
+install() swaps them into the genai module; call it before the app handles requests.
+"""
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import google.generativeai as genai
+
+EMBEDDING_DIM = 768
+
+WORDS = ("Store", "the", "vaccine", "between", "+2°C", "and", "+8°C,", "away", "from", "light;",
+         "do", "not", "freeze", "it", "and", "record", "the", "fridge", "temperature", "daily.")
+
+
+class FakeFunctionCall:
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+
+class FakePart:
+    def __init__(self, text: str = "", function_call: Optional[FakeFunctionCall] = None):
+        self.text = text
+        self.function_call = function_call
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.cached_content_token_count = 0
+        self.candidates_token_count = output_tokens
+
+
+class FakeContent:
+    def __init__(self, parts: List[FakePart]):
+        self.parts = parts
+
+
+class FakeCandidate:
+    def __init__(self, parts: List[FakePart]):
+        self.content = FakeContent(parts)
+
+
+class FakeResponse:
+    """The attributes of GenerateContentResponse the endpoints read: parts, text, candidates, usage_metadata."""
+
+    def __init__(self, parts: List[FakePart], usage: Optional[FakeUsage] = None):
+        self.parts = parts
+        self.candidates = [FakeCandidate(parts)]
+        self.usage_metadata = usage
+
+    @property
+    def text(self) -> str:
+        return "".join(part.text for part in self.parts)
+
+
+class FakeStream:
+    """A streamed response: iterating it yields one chunk every chunk_latency seconds."""
+
+    def __init__(self, chunks: List[FakeResponse], chunk_latency: float, usage: FakeUsage):
+        self.chunks = chunks
+        self.chunk_latency = chunk_latency
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.chunk_latency)
+            yield chunk
+
+
+class FakeChatSession:
+    def __init__(self, model: "FakeGenerativeModel", history: List[Any]):
+        self.model = model
+        self.history = list(history or [])
+        self.turns = 0
+
+    def send_message(self, content, stream: bool = False, tool_config: Optional[Dict[str, Any]] = None, **kwargs):
+        model = self.model
+        self.turns += 1
+        prompt = content if isinstance(content, str) else "tool results"
+        seed = zlib.crc32(f"{prompt}|{self.turns}".encode())
+        # Deterministic jitter: the same conversation always takes the same time
+        latency = (model.latency_ms + (seed % 1000) / 1000 * model.jitter_ms) / 1000
+        usage = FakeUsage(prompt_tokens=model.prompt_tokens + 50 * len(self.history), output_tokens=model.answer_words)
+
+        calls_allowed = (tool_config or {}).get("function_calling_config", {}).get("mode") != "NONE"
+        if model.tools and calls_allowed and self.turns <= model.tool_rounds:
+            time.sleep(latency)
+            parts = [
+                FakePart(function_call=FakeFunctionCall("search_vaccine_database", {"query": f"{prompt[:40]} #{i}"}))
+                for i in range(model.calls_per_round)
+            ]
+            response = FakeResponse(parts, usage)
+            # A streamed tool round arrives as one chunk holding all the calls
+            return FakeStream([response], 0.0, usage) if stream else response
+
+        words = [WORDS[(seed + i) % len(WORDS)] for i in range(model.answer_words)]
+        if not stream:
+            time.sleep(latency)
+            return FakeResponse([FakePart(text=" ".join(words))], usage)
+
+        # Time to first chunk is the turn latency, then one chunk per chunk_words words
+        time.sleep(latency)
+        size = max(1, model.chunk_words)
+        chunks = [
+            FakeResponse([FakePart(text=" ".join(words[i:i + size]) + " ")])
+            for i in range(0, len(words), size)
+        ]
+        return FakeStream(chunks, model.chunk_latency_ms / 1000, usage)
+
+
+class FakeGenerativeModel:
+    """Accepts GenerativeModel's constructor arguments; the behaviour comes from the class-level settings below."""
+
+    latency_ms = 300.0
+    jitter_ms = 0.0
+    chunk_latency_ms = 20.0
+    chunk_words = 4
+    answer_words = 60
+    prompt_tokens = 700
+    tool_rounds = 1
+    calls_per_round = 1
+
+    def __init__(self, model_name: str = "fake", tools=None, system_instruction: Optional[str] = None, **kwargs):
+        self.model_name = model_name
+        self.tools = tools
+        self.system_instruction = system_instruction
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls()
+
+    def start_chat(self, history=None) -> FakeChatSession:
+        return FakeChatSession(self, history)
+
+
+class FakeEmbedder:
+    def __init__(self, latency_ms: float = 30.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        v = rng.standard_normal(EMBEDDING_DIM)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def __call__(self, model: str, content, task_type: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.latency_ms / 1000)  # one round-trip per call, batched or not
+        if isinstance(content, list):
+            return {"embedding": [self.vector(text) for text in content]}
+        return {"embedding": self.vector(content)}
+
+
+def install(
+    latency_ms: float = 300.0,
+    jitter_ms: float = 0.0,
+    chunk_latency_ms: float = 20.0,
+    tool_rounds: int = 1,
+    calls_per_round: int = 1,
+    answer_words: int = 60,
+    embed_latency_ms: float = 30.0,
+) -> FakeEmbedder:
+    """Replaces the Gemini SDK entry points the service uses with the fakes and returns the embedder."""
+    FakeGenerativeModel.latency_ms = latency_ms
+    FakeGenerativeModel.jitter_ms = jitter_ms
+    FakeGenerativeModel.chunk_latency_ms = chunk_latency_ms
+    FakeGenerativeModel.tool_rounds = tool_rounds
+    FakeGenerativeModel.calls_per_round = calls_per_round
+    FakeGenerativeModel.answer_words = answer_words
+
+    embedder = FakeEmbedder(embed_latency_ms)
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.embed_content = embedder
+    return embedder
@@ -0,0 +1,94 @@
+"""
+Stand-in for the Node backend's GET /api/staff/centre_vaccine/{id}/daily.
+
+Serves deterministic synthetic histories (seeded by the id) so the AI service can be
+benchmarked without MongoDB or real tokens. Run standalone with:
+
+    python benchmarks/stub_backend.py --port 8000 --days 100 --latency-ms 5
+"""
+import time
+import zlib
+import socket
+import asyncio
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+
+
+def synthetic_daily(centre_vaccine_id: str, days: int = 100, end: date = None):
+    """Weekly-seasonal used/wasted counts with a slow trend, same output for the same id."""
+    rng = np.random.default_rng(zlib.crc32(centre_vaccine_id.encode()))
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+
+    t = np.arange(days)
+    base = rng.uniform(20, 120)
+    weekly = 1.0 + 0.3 * np.sin(2 * np.pi * t / 7)
+    used = np.maximum(0, np.round(base * weekly + 0.05 * t + rng.normal(0, base * 0.1, days)))
+    wasted = np.maximum(0, np.round(used * rng.uniform(0.02, 0.08) + rng.normal(0, 1, days)))
+
+    return [
+        {"date": (start + timedelta(days=i)).isoformat(), "total_dose_used": float(u), "total_dose_wasted": float(w)}
+        for i, (u, w) in enumerate(zip(used, wasted))
+    ]
+
+
+def make_stub_app(days: int = 100, latency_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Stub TikaSheba backend")
+    app.state.calls = 0
+
+    @app.get("/api/staff/centre_vaccine/{centre_vaccine_id}/daily")
+    async def daily(centre_vaccine_id: str):
+        app.state.calls += 1
+        if latency_ms:
+            # Simulates the controller re-aggregating vaccine_log from MongoDB
+            await asyncio.sleep(latency_ms / 1000)
+        return {
+            "centre_vaccine_id": centre_vaccine_id,
+            "centre_id": "VC_STUB",
+            "vaccine_name": "STUB",
+            "daily": synthetic_daily(centre_vaccine_id, days),
+        }
+
+    @app.get("/stub/calls")
+    async def calls():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def run_stub_backend(port: int = None, days: int = 100, latency_ms: float = 0.0):
+    """Runs the stub in a background thread and yields its base URL."""
+    port = port or free_port()
+    config = uvicorn.Config(make_stub_app(days, latency_ms), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(make_stub_app(args.days, args.latency_ms), host="127.0.0.1", port=args.port, log_level="warning")
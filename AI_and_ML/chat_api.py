@@ -0,0 +1,501 @@
+"""
+Chat router: the /chat, /center_chat, /authority_chat and /faq_chat personas (plus their /stream
+variants and server-side sessions). Retrieval for the search tool comes from rag_api.
+"""
+import os
+import time
+import json
+import asyncio
+import logging
+from typing import List, Optional, Dict, Any, Tuple
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+import google.generativeai as genai
+from google.generativeai.types import content_types
+
+import rag_api
+from rag_api import embed_texts, query_pinecone, run_blocking
+from gemini_models import PersonaModels
+from faq_cache import FAQAnswerCache, faq_questions
+from session_store import create_session_store
+from metrics import Counter, Gauge, Histogram, stage
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# --- 1. Configuration ---
+# Each chat endpoint admits a limited number of turns at once (the rest wait)
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "16"))
+FAQ_CHAT_CONCURRENCY = int(os.getenv("FAQ_CHAT_CONCURRENCY", "16"))
+
+endpoint_limits = {
+    "chat": asyncio.Semaphore(CHAT_CONCURRENCY),
+    "center_chat": asyncio.Semaphore(CHAT_CONCURRENCY),
+    "authority_chat": asyncio.Semaphore(CHAT_CONCURRENCY),
+    "faq_chat": asyncio.Semaphore(FAQ_CHAT_CONCURRENCY),
+}
+
+_background_tasks: List[asyncio.Task] = []
+
+async def startup() -> None:
+    # The search tool needs Gemini embeddings and the vector index
+    await rag_api.startup()
+    await asyncio.to_thread(persona_models.build_all)
+    if persona_models.context_cache:
+        _background_tasks.append(asyncio.create_task(refresh_context_caches_loop()))
+
+async def shutdown() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.to_thread(persona_models.close)
+    await rag_api.shutdown()
+
+# --- 2. Data Models ---
+# Simplified message model for input history
+class HistoryMessage(BaseModel):
+    role: str = Field(..., pattern="^(user|model)$") # Gemini uses 'model', not 'assistant'
+    content: str
+
+class ChatRequest(BaseModel):
+    message: str = Field(..., example="How do I store BCG?")
+    history: List[HistoryMessage] = Field(default_factory=list)
+    # Session mode (POST /chat/sessions): send only the new message, the server keeps the recent history
+    session_id: Optional[str] = Field(None, description="Server-side session; replaces history when set")
+
+
+class ChatResponse(BaseModel):
+    response: str
+    history: Optional[List[HistoryMessage]] = None  # omitted in session mode
+    session_id: Optional[str] = None
+
+# --- 3. Gemini Tool Definition ---
+# We define the tool as a Python function, Gemini SDK handles the rest beautifully.
+def search_vaccine_database(query: str) -> str:
+    """
+    Query the Bangladesh vaccine database for factual details.
+    Use this tool WHENEVER the user asks about vaccine names, storage, schedules, or side effects.
+    Args:
+        query: The specific search query, e.g., 'BCG storage temperature'
+    """
+    # This is a wrapper to make it easy for Gemini to call
+    return query_pinecone(query)
+
+# Define the tool list for the model
+gemini_tools = [search_vaccine_database]
+tool_functions = {fn.__name__: fn for fn in gemini_tools}
+
+# Gemini may ask for several searches in one turn (e.g. "BCG vs MR storage") and then more in the next;
+# after this many rounds it has to answer with what it already retrieved
+CHAT_MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "4"))
+# Reply when the model still asks for tools after the last allowed round instead of answering
+TOOL_LIMIT_FALLBACK = "Sorry, I couldn't finish looking that up. Please try again or ask a more specific question."
+
+TOOL_CALLS = Counter("ai_tool_calls_total", "Function calls answered in the chat tool loop.", ["tool"])
+TOOL_ROUNDS = Histogram("ai_tool_rounds", "Tool-loop rounds per chat turn.", ["persona"], buckets=range(CHAT_MAX_TOOL_ROUNDS + 2))
+LLM_IN_FLIGHT = Gauge("ai_llm_calls_in_flight", "Gemini generate calls currently running (streamed ones until their last chunk).")
+
+def call_tool(fn) -> str:
+    """Runs one function_call part. Unknown tools get an error result, since every call needs a response."""
+    tool = tool_functions.get(fn.name)
+    if tool is None:
+        return f"Unknown tool '{fn.name}'."
+    # Handle potential argument parsing issues safely
+    args = dict(fn.args)
+    q = args.get('query') or next(iter(args.values()), "")
+    return tool(query=q)
+
+async def answer_tool_calls(calls) -> "genai.protos.Content":
+    """Runs all function calls of a turn concurrently and packs every result into one message."""
+    for fn in calls:
+        logger.debug("Calling tool %s", fn.name)
+        TOOL_CALLS.inc(tool=fn.name)
+    results = await asyncio.gather(*[run_blocking(call_tool, fn) for fn in calls], return_exceptions=True)
+    return genai.protos.Content(
+        parts=[
+            genai.protos.Part(
+                function_response=genai.protos.FunctionResponse(
+                    name=fn.name,
+                    response={'result': result if isinstance(result, str) else f"Tool error: {result}"}
+                )
+            )
+            for fn, result in zip(calls, results)
+        ]
+    )
+
+def tool_config_after(rounds: int) -> Optional[Dict[str, Any]]:
+    # Last allowed round: no further function calls, the model answers from the results it has
+    return {"function_calling_config": {"mode": "NONE"}} if rounds >= CHAT_MAX_TOOL_ROUNDS else None
+
+async def llm_turn(chat, message, persona: str, **kwargs):
+    """One (non-streamed) Gemini call, timed as the llm_turn stage."""
+    with stage("llm_turn"), LLM_IN_FLIGHT.track_in_flight():
+        response = await run_blocking(chat.send_message, message, **kwargs)
+    persona_models.record_usage(persona, response)
+    return response
+
+async def send_with_tools(chat, message, persona: str):
+    """
+    Sends the message and answers the model's function calls until it replies with text.
+    All function calls of a turn run concurrently and their results go back in one message.
+    """
+    response = await llm_turn(chat, message, persona, tool_config=tool_config_after(0))
+    rounds = 0
+    while rounds < CHAT_MAX_TOOL_ROUNDS and response.parts and any(part.function_call for part in response.parts):
+        calls = [part.function_call for part in response.parts if part.function_call]
+        tool_message = await answer_tool_calls(calls)
+        rounds += 1
+        response = await llm_turn(chat, tool_message, persona, tool_config=tool_config_after(rounds))
+    TOOL_ROUNDS.observe(rounds, persona=persona)
+    return response
+
+def final_text(response) -> str:
+    """
+    The answer text of send_with_tools' last response. If the model still asked for tools past the
+    round limit, response.text would raise on the function_call parts: keep any text, else the fallback.
+    """
+    if not any(part.function_call for part in response.parts):
+        return response.text
+    text = "".join(part.text for part in response.parts if not part.function_call and part.text)
+    return text or TOOL_LIMIT_FALLBACK
+
+async def iterate_blocking(iterable, limit: Optional[asyncio.Semaphore] = None):
+    """
+    Async iteration over a blocking iterator (a streamed Gemini response), one next() per executor call.
+    With a limit, each next() holds it; the time the consumer spends on an item does not.
+    """
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        if limit is None:
+            item = await run_blocking(next, iterator, done)
+        else:
+            async with limit:
+                item = await run_blocking(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+async def stream_with_tools(chat, message, persona: str):
+    """
+    Streaming form of send_with_tools. Yields ("token", text) as the model generates and
+    ("tool", {"name", "query"}) when it pauses for a tool round; the tool calls run mid-stream.
+    The persona's endpoint limit is held only while calling Gemini or the tools, not while a
+    token is on its way to a slow client.
+    """
+    limit = endpoint_limits[persona]
+    rounds = 0
+    while True:
+        calls = []
+        answered = False
+        # The llm_turn stage runs until the last chunk, so it includes the time spent sending tokens to the client
+        with stage("llm_turn"), LLM_IN_FLIGHT.track_in_flight():
+            async with limit:
+                response = await run_blocking(chat.send_message, message, stream=True, tool_config=tool_config_after(rounds))
+            async for chunk in iterate_blocking(response, limit):
+                for part in (chunk.candidates[0].content.parts if chunk.candidates else []):
+                    if part.function_call:
+                        calls.append(part.function_call)
+                    elif part.text:
+                        answered = True
+                        yield "token", part.text
+        persona_models.record_usage(persona, response)
+        if not calls or rounds >= CHAT_MAX_TOOL_ROUNDS:
+            if calls and not answered:
+                yield "token", TOOL_LIMIT_FALLBACK
+            TOOL_ROUNDS.observe(rounds, persona=persona)
+            return
+
+        for fn in calls:
+            args = dict(fn.args)
+            yield "tool", {"name": fn.name, "query": args.get('query') or next(iter(args.values()), "")}
+        async with limit:
+            message = await answer_tool_calls(calls)
+        rounds += 1
+
+# --- 4. Chat personas ---
+# Every chat endpoint is the same Gemini chat with a different system instruction, tool set and history window.
+CHAT_MODEL_NAME = 'gemini-2.5-flash'
+
+CHAT_SYSTEM_INSTRUCTION = "You are a helpful assistant for Bangladesh vaccination. Use the 'search_vaccine_database' tool for factual vaccine info. If you dont fine info in this database, answer from your own knowledge. But dont tell the user that you didn't find the information in the database. Make sure your response is nicely formatted. If the user ask something like what was my previous prompt or conversation you reply your past conversation was about vaccines. Also add something more if necessary."
+
+PRESERVATION_SYSTEM_INSTRUCTION = "You are a helpful assistant for Bangladesh vaccination preservation. Use the 'search_vaccine_database' tool for factual vaccine info. If you dont fine info in this database, answer from your own knowledge. But dont tell the user that you didn't find the information in the database. Make sure your response is nicely formatted. If the user ask something like what was my previous prompt or conversation you reply your past conversation was about vaccines. Also add something more if necessary. Also if the user ask anything that is not regarding to vaccine or vaccine preservation, tell the user to ask vaccine or vaccine preservation related questions."
+
+FAQ_SYSTEM_INSTRUCTION = "You are a helpful FAQ assistant for Bangladesh vaccination services. Answer questions clearly, accurately, and concisely based on your general knowledge about vaccines in Bangladesh. Make sure your response is nicely formatted. If the user asks anything NOT related to vaccines, health, or preservation, politely refuse and ask them to stay on topic. To give you some context, here are answer to some frequently asked questions : Here are the answers to your FAQs, refined for clarity and tone: * **How do I register if I don't have a National ID (NID) card?** You can register using your Birth Certificate number if you do not have an NID card. * **Can I change my vaccination center after booking an appointment?** Yes, you can cancel your current appointment and book a new one at a different center. However, we highly discourage this as it may waste a valuable slot at the original center. * **What should I do if I miss my scheduled appointment?** You will need to book a new appointment. Please try to be punctual in the future to avoid wasting vaccine center resources and slots. * **Is my personal information secure?** Yes, your data is completely secure. We do not use your personal information for anything outside of this vaccination system. * **How can I report side effects after getting vaccinated?** Most vaccines have common, mild side effects like fever or weakness for 1-2 days. If your condition concerns you, please contact your vaccination center or consult a doctor. * **Can I book an appointment for someone else (e.g., a family member)?** No, you cannot book directly from your account. However, you can create a separate account for them and book an appointment through their profile. * **What if I lost my digital vaccine card? Can I regenerate it?** Yes, you can regenerate and download your digital vaccine card at any time from your profile. * **Are the vaccines free, or do I need to pay?** All mandatory government (EPI) vaccines are free. Some specialized or optional vaccines may have a cost. * **How do I know if I am eligible for a specific vaccine?** Everyone is eligible for vaccines based on their age and vaccination history. The system will show you which vaccines you currently need. * **Can I use this system if I am a foreign national living in the country?** No, currently this system is designed only for Bangladeshi citizens with a valid NID or Birth Certificate. What happens if someone else used my NID to register? Please contact the relevant authority immediately or call our hotline for assistance."
+
+PERSONAS = {
+    "chat": {"system_instruction": CHAT_SYSTEM_INSTRUCTION, "tools": gemini_tools, "history_window": 3},
+    "center_chat": {"system_instruction": PRESERVATION_SYSTEM_INSTRUCTION, "tools": gemini_tools, "history_window": 3},
+    "authority_chat": {"system_instruction": PRESERVATION_SYSTEM_INSTRUCTION, "tools": gemini_tools, "history_window": 3},
+    # No tools for the FAQ; a longer window helps with follow-ups ("What about for kids?")
+    "faq_chat": {"system_instruction": FAQ_SYSTEM_INSTRUCTION, "tools": None, "history_window": 5},
+}
+
+# One shared model per persona, built at startup (optionally backed by a Gemini context cache, GEMINI_CONTEXT_CACHE=1)
+persona_models = PersonaModels(CHAT_MODEL_NAME, PERSONAS)
+
+def start_persona_chat(persona: str, history: List[HistoryMessage]):
+    """Starts a Gemini chat on the persona's shared model, replaying the last few history messages."""
+    started = time.perf_counter()
+    gemini_history = [
+        content_types.to_content({"role": msg.role, "parts": [msg.content]})
+        for msg in history[-PERSONAS[persona]["history_window"]:]
+    ]
+    chat = persona_models.get(persona).start_chat(history=gemini_history)
+    persona_models.record_setup(persona, time.perf_counter() - started)
+    return chat
+
+# Answers to repeated FAQ questions (and, with FAQ_CACHE_SEMANTIC=1, close paraphrases of the canonical ones)
+faq_cache = FAQAnswerCache(
+    faq_questions(FAQ_SYSTEM_INSTRUCTION),
+    embed=lambda texts: embed_texts(texts, "SEMANTIC_SIMILARITY"),
+    history_window=PERSONAS["faq_chat"]["history_window"],
+)
+
+async def cached_faq_answer(message: str, history: List[HistoryMessage]) -> Tuple[Optional[str], List[str]]:
+    """
+    Looks the turn up in the FAQ answer cache: the exact question first, then (semantic mode) the
+    answer to the closest canonical FAQ question. Returns the answer (None on a miss) and the keys
+    to store a fresh answer under: the canonical key only when the message is that FAQ question itself.
+    """
+    keys = [faq_cache.exact_key(message, history)]
+    answer = faq_cache.get(keys[0])
+    if answer is None and faq_cache.semantic:
+        own = faq_cache.own_canonical_key(message, history)
+        if own is not None:
+            keys.append(own)
+            return answer, keys
+        try:
+            canonical = await run_blocking(faq_cache.canonical_key, message, history)
+        except Exception as e:
+            print(f"FAQ Match Error: {e}")
+            canonical = None
+        if canonical is not None:
+            answer = faq_cache.get(canonical, semantic=True)
+    return answer, keys
+
+# Session mode: recent messages per session id live here instead of in every request and response
+session_store = create_session_store()
+
+async def load_history(req: ChatRequest) -> List[HistoryMessage]:
+    """The client's history, or in session mode the stored window (404 when the session is unknown or expired)."""
+    if req.session_id is None:
+        return req.history
+    messages = await asyncio.to_thread(session_store.get, req.session_id)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired; create a new one.")
+    return [HistoryMessage(**msg) for msg in messages]
+
+async def complete_turn(req: ChatRequest, final_answer: str) -> ChatResponse:
+    """Stateless mode echoes the updated history; session mode stores the turn and returns only the reply."""
+    if req.session_id is None:
+        updated_history = list(req.history)
+        updated_history.append(HistoryMessage(role="user", content=req.message))
+        updated_history.append(HistoryMessage(role="model", content=final_answer))
+        return ChatResponse(response=final_answer, history=updated_history)
+
+    await asyncio.to_thread(
+        session_store.append,
+        req.session_id,
+        [{"role": "user", "content": req.message}, {"role": "model", "content": final_answer}],
+    )
+    return ChatResponse(response=final_answer, session_id=req.session_id)
+
+async def refresh_context_caches_loop():
+    """Keeps the persona context caches alive: extends their TTL at half its length."""
+    while True:
+        await asyncio.sleep(persona_models.cache_ttl.total_seconds() / 2)
+        await asyncio.to_thread(persona_models.refresh_caches)
+
+# --- 5. API Endpoints ---
+
+@router.get("/chat/model_stats")
+async def chat_model_stats():
+    """Per persona: model builds, average per-request setup time and the token counts Gemini reported."""
+    return persona_models.stats()
+
+
+@router.get("/faq_cache_stats")
+async def faq_cache_stats():
+    """Exact and canonical-question hits of the FAQ answer cache (each hit is one LLM call saved)."""
+    return faq_cache.stats()
+
+
+@router.post("/chat/sessions")
+async def create_chat_session():
+    """Starts a server-side conversation; pass the returned session_id with each message instead of history."""
+    return {"session_id": await asyncio.to_thread(session_store.create)}
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    await asyncio.to_thread(session_store.delete, session_id)
+    return {"status": "deleted"}
+
+
+@router.get("/chat/session_stats")
+async def chat_session_stats():
+    return await asyncio.to_thread(session_store.stats)  # SQLite counts, kept off the event loop
+
+
+@router.post("/chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat_endpoint(req: ChatRequest):
+    try:
+        # 1. Persona model + the last few messages of history (from the request or the session)
+        chat = start_persona_chat("chat", await load_history(req))
+
+        # 2. Send Message & Handle Tool Loop (all calls of a turn run concurrently)
+        async with endpoint_limits["chat"]:
+            response = await send_with_tools(chat, req.message, "chat")
+
+        # 3. FINAL ANSWER extraction
+        final_answer = final_text(response)
+
+        # 4. Return the answer with the updated history (or store it, in session mode)
+        return await complete_turn(req, final_answer)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Gemini Error Details: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+
+@router.post("/center_chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def center_chat_endpoint(req: ChatRequest):
+    try:
+        # 1. Persona model + the last few messages of history (from the request or the session)
+        chat = start_persona_chat("center_chat", await load_history(req))
+
+        # 2. Send Message & Handle Tool Loop (all calls of a turn run concurrently)
+        async with endpoint_limits["center_chat"]:
+            response = await send_with_tools(chat, req.message, "center_chat")
+
+        # 3. FINAL ANSWER extraction
+        final_answer = final_text(response)
+
+        # 4. Return the answer with the updated history (or store it, in session mode)
+        return await complete_turn(req, final_answer)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Gemini Error Details: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/authority_chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def authority_chat_endpoint(req: ChatRequest):
+    try:
+        # 1. Persona model + the last few messages of history (from the request or the session)
+        chat = start_persona_chat("authority_chat", await load_history(req))
+
+        # 2. Send Message & Handle Tool Loop (all calls of a turn run concurrently)
+        async with endpoint_limits["authority_chat"]:
+            response = await send_with_tools(chat, req.message, "authority_chat")
+
+        # 3. FINAL ANSWER extraction
+        final_answer = final_text(response)
+
+        # 4. Return the answer with the updated history (or store it, in session mode)
+        return await complete_turn(req, final_answer)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Gemini Error Details: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/faq_chat", response_model=ChatResponse, response_model_exclude_none=True)
+async def faq_chat_endpoint(req: ChatRequest):
+    try:
+        history = await load_history(req)
+
+        # 1. Answer cache: repeated and paraphrased FAQ questions return without an LLM call
+        final_answer, cache_keys = await cached_faq_answer(req.message, history)
+
+        if final_answer is None:
+            # 2. Persona model + the last few messages of history
+            chat = start_persona_chat("faq_chat", history)
+
+            # 3. Send Message (Just a simple prompt-response now) and extract the final answer
+            async with endpoint_limits["faq_chat"]:
+                response = await send_with_tools(chat, req.message, "faq_chat")
+            final_answer = final_text(response)
+            faq_cache.put(cache_keys, final_answer)
+
+        # 4. Return response and new history (or store it, in session mode)
+        return await complete_turn(req, final_answer)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        # print(f"Gemini FAQ Error: {e}") # Optional: Log errors internally
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Streaming (SSE) variants of the chat endpoints ---
+# Same personas and request body; the answer arrives as server-sent events:
+#   event: token    data: {"text": "..."}                        (as the model generates)
+#   event: tool     data: {"name": "...", "query": "..."}        (a tool round is running)
+#   event: history  data: {"response": "...", "history": [...]}  (last event, same shape as ChatResponse;
+#                                                                 {"response", "session_id"} in session mode)
+#   event: error    data: {"detail": "..."}
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chat(persona: str, req: ChatRequest) -> StreamingResponse:
+    history = await load_history(req)  # an unknown session is a plain 404, before the stream starts
+
+    async def events():
+        try:
+            final_answer, cache_keys = await cached_faq_answer(req.message, history) if persona == "faq_chat" else (None, [])
+            if final_answer is not None:
+                yield sse_event("token", {"text": final_answer})
+            else:
+                chat = start_persona_chat(persona, history)
+                answer = []
+                async for kind, payload in stream_with_tools(chat, req.message, persona):
+                    if kind == "token":
+                        answer.append(payload)
+                        yield sse_event("token", {"text": payload})
+                    else:
+                        yield sse_event("tool", payload)
+                final_answer = "".join(answer)
+                if cache_keys:
+                    faq_cache.put(cache_keys, final_answer)
+
+            yield sse_event("history", (await complete_turn(req, final_answer)).model_dump(exclude_none=True))
+        except Exception as e:
+            print(f"Gemini Stream Error: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # no proxy buffering of the events
+    )
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    return await stream_chat("chat", req)
+
+
+@router.post("/center_chat/stream")
+async def center_chat_stream_endpoint(req: ChatRequest):
+    return await stream_chat("center_chat", req)
+
+
+@router.post("/authority_chat/stream")
+async def authority_chat_stream_endpoint(req: ChatRequest):
+    return await stream_chat("authority_chat", req)
+
+
+@router.post("/faq_chat/stream")
+async def faq_chat_stream_endpoint(req: ChatRequest):
+    return await stream_chat("faq_chat", req)
@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import hashlib
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from cache_utils import LRUCache, SQLiteConnections
+
+# Embeddings are deterministic for (model, task_type, text), so they can be kept indefinitely
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case/whitespace-insensitive form used for the cache key ("BCG  storage" == "bcg storage")."""
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def embedding_key(model: str, task_type: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{task_type}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU of float32 vectors in front of a SQLite table.
+    Vectors are stored as raw float32 blobs (3 KB for a 768-dim embedding).
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.memory = LRUCache(max_entries=memory_entries)
+        self._db = SQLiteConnections(path, _SCHEMA)
+        self.disk_hits = 0
+        self.embed_calls = 0
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        key = embedding_key(model, task_type, text)
+        vector = self.memory.get(key)
+        if vector is None:
+            row = self._db.connection().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self.memory.set(key, vector)
+            self.disk_hits += 1
+        return vector.tolist()
+
+    def put(self, model: str, task_type: str, text: str, vector: List[float]) -> None:
+        key = embedding_key(model, task_type, text)
+        array = np.asarray(vector, dtype=np.float32)
+        self.memory.set(key, array)
+        conn = self._db.connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, task_type, len(array), array.tobytes(), time.time()),
+            )
+
+    def get_or_embed(self, model: str, task_type: str, text: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """Returns the cached vector, or calls embed(text) once and stores the result."""
+        vector = self.get(model, task_type, text)
+        if vector is None:
+            self.embed_calls += 1
+            vector = embed(text)
+            self.put(model, task_type, text, vector)
+        return vector
+
+    def get_or_embed_many(
+        self,
+        model: str,
+        task_type: str,
+        texts: List[str],
+        embed_many: Callable[[List[str]], List[List[float]]],
+        batch_size: int = 100,
+    ) -> List[List[float]]:
+        """
+        Batch form of get_or_embed: cached texts are served locally and the misses (deduplicated)
+        go out in embed_many calls of at most batch_size texts each. Results keep the input order.
+        """
+        vectors: List[Optional[List[float]]] = [self.get(model, task_type, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+        embedded = {}
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            self.embed_calls += 1
+            for text, vector in zip(batch, embed_many(batch)):
+                self.put(model, task_type, text, vector)
+                embedded[text] = vector
+
+        return [vector if vector is not None else embedded[text] for text, vector in zip(texts, vectors)]
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        rows = self._db.connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "memory_entries": memory["entries"],
+            "memory_hits": memory["hits"],
+            "disk_rows": rows,
+            "disk_hits": self.disk_hits,
+            "embed_calls": self.embed_calls,
+        }
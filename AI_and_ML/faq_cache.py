@@ -0,0 +1,120 @@
+import os
+import re
+import hashlib
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from cache_utils import LRUCache
+from embedding_cache import normalize_text
+
+FAQ_CACHE_MAX_ENTRIES = int(os.getenv("FAQ_CACHE_MAX_ENTRIES", "1024"))
+FAQ_CACHE_TTL_SECONDS = float(os.getenv("FAQ_CACHE_TTL_SECONDS", "86400"))
+# Opt-in: also match paraphrases of the canonical FAQ questions by embedding similarity (one embed call per new question)
+FAQ_CACHE_SEMANTIC = os.getenv("FAQ_CACHE_SEMANTIC", "0") == "1"
+FAQ_CACHE_THRESHOLD = float(os.getenv("FAQ_CACHE_THRESHOLD", "0.9"))
+
+_BOLD_QUESTION = re.compile(r"\*\*(.+?\?)\*\*")
+
+
+def faq_questions(system_instruction: str) -> List[str]:
+    """The canonical questions listed in the FAQ system instruction (the bold "**...?**" items)."""
+    return _BOLD_QUESTION.findall(system_instruction)
+
+
+def history_fingerprint(history, window: int) -> str:
+    """Hash of the history messages the model would actually see (the last `window`)."""
+    digest = hashlib.sha256()
+    for msg in history[-window:] if window else []:
+        digest.update(f"{msg.role}\0{normalize_text(msg.content)}\0".encode())
+    return digest.hexdigest()[:16]
+
+
+class FAQAnswerCache:
+    """
+    Answers to FAQ chat turns, keyed by normalized question + history fingerprint.
+
+    With semantic matching on, a question that is not an exact repeat can still hit through the
+    canonical FAQ list: if its embedding is within threshold of a canonical question, it gets the
+    answer the model gave to that canonical question itself. Answers to paraphrases are only stored
+    under their own exact key, so one user's wording ("side effects for my 9-month-old") is never
+    served to everyone whose question is close to the same FAQ.
+    """
+
+    def __init__(
+        self,
+        canonical_questions: List[str],
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        history_window: int = 5,
+        semantic: bool = FAQ_CACHE_SEMANTIC,
+        threshold: float = FAQ_CACHE_THRESHOLD,
+        max_entries: int = FAQ_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = FAQ_CACHE_TTL_SECONDS,
+    ):
+        self.canonical_questions = canonical_questions
+        self.embed = embed
+        self.history_window = history_window
+        self.semantic = semantic and embed is not None and bool(canonical_questions)
+        self.threshold = threshold
+        self.answers = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._canonical_index = {normalize_text(q): i for i, q in enumerate(canonical_questions)}
+
+        self._lock = threading.Lock()
+        self._canonical: Optional[np.ndarray] = None  # unit vectors of the canonical questions, embedded on first use
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def exact_key(self, question: str, history) -> str:
+        return f"q:{normalize_text(question)}|{history_fingerprint(history, self.history_window)}"
+
+    def _faq_key(self, index: int, history) -> str:
+        return f"faq:{index}|{history_fingerprint(history, self.history_window)}"
+
+    def own_canonical_key(self, question: str, history) -> Optional[str]:
+        """Key of the canonical FAQ question this question is (after normalization), else None. No embedding."""
+        index = self._canonical_index.get(normalize_text(question))
+        return None if index is None else self._faq_key(index, history)
+
+    def canonical_key(self, question: str, history) -> Optional[str]:
+        """Key of the closest canonical FAQ question, or None below threshold. Blocking (embeds the question)."""
+        with self._lock:
+            if self._canonical is None:
+                vectors = np.asarray(self.embed(self.canonical_questions), dtype=np.float32)
+                self._canonical = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        vector = np.asarray(self.embed([question])[0], dtype=np.float32)
+        sims = self._canonical @ (vector / np.linalg.norm(vector))
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self._faq_key(best, history)
+
+    def get(self, key: str, semantic: bool = False) -> Optional[str]:
+        answer = self.answers.get(key)
+        if answer is not None:
+            if semantic:
+                self.semantic_hits += 1
+            else:
+                self.exact_hits += 1
+        return answer
+
+    def put(self, keys: List[str], answer: str) -> None:
+        self.misses += 1
+        for key in keys:
+            self.answers.set(key, answer)
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.answers),
+            "canonical_questions": len(self.canonical_questions),
+            "semantic": self.semantic,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "llm_calls_saved": hits,
+        }
@@ -0,0 +1,313 @@
+"""
+Forecast router: Prophet / Holt-Winters forecasts from posted history or from the backend's daily usage.
+Imports pandas and Prophet; chat-only deployments leave this router (and those imports) out.
+"""
+import os
+import json
+import asyncio
+from typing import List, Optional, Dict, Any, Literal
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+
+from forecasting import ForecastPool, ForecastQueueFull, prepare_arrow, prepare_columns, prepare_history
+from backend_client import (
+    close_backend_client, daily_records_to_columns, fetch_daily_usage_cached, get_backend_client, history_cache_stats
+)
+from forecast_store import ForecastStore
+from forecast_precompute import FORECAST_PRECOMPUTE_AT, FORECAST_PRECOMPUTE_TOKEN, nightly_precompute_loop
+from auth_utils import verify_bearer_token, can_read_centre
+from metrics import Gauge
+
+router = APIRouter()
+
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+
+_background_tasks: List[asyncio.Task] = []
+
+async def startup() -> None:
+    # Long-lived clients and worker pools are opened once per process and closed on shutdown
+    get_backend_client()
+    forecast_pool.start()
+    if FORECAST_PRECOMPUTE_AT and FORECAST_PRECOMPUTE_TOKEN:
+        _background_tasks.append(asyncio.create_task(
+            nightly_precompute_loop(forecast_store, forecast_pool, FORECAST_PRECOMPUTE_AT, FORECAST_PRECOMPUTE_TOKEN)
+        ))
+
+async def shutdown() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    forecast_pool.shutdown()
+    await close_backend_client()
+
+# --- 1. Data Models ---
+
+class DataPoint(BaseModel):
+    date: str = Field(..., description="Date in YYYY-MM-DD format", example="2023-10-27")
+    amphules_used: float = Field(..., description="Number of amphules used on this date", example=120.5)
+
+ForecastModel = Literal["auto", "prophet", "holt_winters"]
+
+class ForecastRequest(BaseModel):
+    history: Optional[List[DataPoint]] = Field(None, description="Historical data array")
+    # Columnar alternative to history for long series: validated as two flat arrays, no object per point
+    dates: Optional[List[str]] = Field(None, description="Dates in YYYY-MM-DD format, parallel to values", example=["2023-10-26", "2023-10-27"])
+    values: Optional[List[float]] = Field(None, description="Amphules used on each of the dates", example=[118.0, 120.5])
+    days_to_forecast: int = Field(..., ge=1, le=365, description="Number of days to predict into the future", example=30)
+    model: ForecastModel = Field("auto", description="Forecasting engine; 'auto' uses Holt-Winters for short histories and Prophet otherwise")
+
+    @model_validator(mode="after")
+    def one_history_format(self):
+        columnar = self.dates is not None or self.values is not None
+        if self.history is not None and columnar:
+            raise ValueError("Send either history or dates/values, not both.")
+        if self.history is None and (self.dates is None or self.values is None):
+            raise ValueError("Send history, or dates and values.")
+        if columnar and len(self.dates) != len(self.values):
+            raise ValueError("dates and values must have the same length.")
+        return self
+
+class ForecastPoint(BaseModel):
+    date: str
+    predicted_usage: float
+    lower_bound: float
+    upper_bound: float
+
+class ForecastResponse(BaseModel):
+    forecast_total: float
+    days_forecasted: int
+    daily_forecast: List[ForecastPoint]
+
+# --- 2. Forecasting Logic ---
+# Prophet fitting lives in forecasting.py and runs in a process pool (FORECAST_WORKERS / FORECAST_MAX_QUEUE)
+# so a multi-second Stan fit never blocks the event loop serving /chat and /faq_chat.
+
+forecast_pool = ForecastPool()
+
+FORECAST_JOBS_IN_FLIGHT = Gauge("ai_forecast_jobs_in_flight", "Forecasts running or queued on the worker pool.")
+FORECAST_JOBS_IN_FLIGHT.set_function(lambda: forecast_pool.in_flight)
+
+# Nightly precomputed forecasts (see forecast_precompute.py); endpoints fall back to live fits on a miss
+forecast_store = ForecastStore()
+
+
+def stored_forecasts(centre_vaccine_id: str, auth_token: str, metrics: List[str], n_days: int) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Returns precomputed forecasts for every metric, or None if any is missing/stale.
+    The store skips the backend, so the token is checked here with the backend's own rules
+    (requires JWT_SECRET; without it every request is computed live).
+    """
+    claims = verify_bearer_token(auth_token)
+    if claims is None:
+        return None
+
+    results = {}
+    for metric in metrics:
+        stored = forecast_store.get(centre_vaccine_id, metric, n_days)
+        if stored is None:
+            return None
+        centre_id, forecast = stored
+        if not can_read_centre(claims, centre_id):
+            return None  # let the live path produce the backend's 403
+        results[metric] = forecast
+    return results
+
+# --- 3. API Endpoint ---
+
+@router.post("/forecast", response_model=ForecastResponse)
+async def get_vaccine_forecast(req: ForecastRequest):
+    """
+    Accepts historical vaccine usage data and returns a future forecast using Meta Prophet.
+    """
+    try:
+        if not (req.history or req.dates):
+             raise HTTPException(status_code=400, detail="Historical data cannot be empty.")
+
+        df = prepare_history(req.history) if req.history is not None else prepare_columns(req.dates, req.values)
+        results = await forecast_pool.forecast(df, req.days_to_forecast, model=req.model)
+        return results
+
+    except HTTPException:
+        raise
+    except ForecastQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        # In production, log the full error traceback
+        print(f"Forecasting Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Model forecasting failed: {str(e)}")
+
+
+@router.post("/forecast/arrow", response_model=ForecastResponse)
+async def forecast_from_arrow(
+    request: Request,
+    days_to_forecast: int = Query(..., ge=1, le=365),
+    model: ForecastModel = Query("auto"),
+):
+    """
+    Same forecast as /forecast from an Apache Arrow IPC stream body (Content-Type
+    application/vnd.apache.arrow.stream) with `date` and `amphules_used` columns.
+    The columns go into the model frame without any per-row conversion. Needs pyarrow on the server.
+    """
+    try:
+        df = prepare_arrow(await request.body())
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Arrow input needs pyarrow installed on the AI service.")
+    except (ValueError, KeyError) as e:  # pyarrow's ArrowInvalid is a ValueError; KeyError is a missing column
+        raise HTTPException(status_code=400, detail=f"Invalid Arrow body: {e}")
+    if df.empty:
+        raise HTTPException(status_code=400, detail="Historical data cannot be empty.")
+
+    try:
+        return await forecast_pool.forecast(df, days_to_forecast, model=model)
+    except ForecastQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        print(f"Forecasting Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Model forecasting failed: {str(e)}")
+
+
+@router.get("/forecast/cache_stats")
+async def forecast_cache_stats():
+    """Hit/miss counters and sizes of the fitted-model and history caches, for sizing FORECAST_CACHE_* / HISTORY_CACHE_* settings."""
+    stats = await forecast_pool.stats()
+    stats["history_cache"] = history_cache_stats()
+    stats["forecast_store"] = await asyncio.to_thread(forecast_store.stats)  # a SQLite COUNT, kept off the event loop
+    return stats
+
+
+# --- New Data Models for Input ---
+class DemandForecastRequest(BaseModel):
+    centre_vaccine_id: str = Field(..., example="690e473c078a4481e3c69863")
+    days_to_forecast: int = Field(..., ge=1, le=365, example=30)
+    # --- Change 1: Added auth_token field ---
+    auth_token: str = Field(..., example="Bearer abc123xyz789", description="Authorization token for the external historical API.")
+    # ----------------------------------------
+    fresh: bool = Field(False, description="Skip the nightly precomputed forecast and fit on live data.")
+    model: ForecastModel = Field("auto", description="Forecasting engine; anything but 'auto' always fits on live data")
+
+class UsageForecastResponse(BaseModel):
+    demand: ForecastResponse
+    waste: ForecastResponse
+
+# --- Shared helpers for the backend-driven forecasts ---
+
+async def forecast_metrics(req: DemandForecastRequest, metrics: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetches the daily series once and forecasts every requested metric from it in parallel."""
+    # 0. Answer from the nightly precompute when we can (milliseconds instead of a fit)
+    # (the precompute fits with model="auto", so an explicit engine skips it)
+    if not req.fresh and req.model == "auto":
+        stored = stored_forecasts(req.centre_vaccine_id, req.auth_token, metrics, req.days_to_forecast)
+        if stored is not None:
+            return stored
+
+    # 1. Fetch historical data from external API (cached briefly, concurrent identical fetches coalesced)
+    daily_records = await fetch_daily_usage_cached(req.centre_vaccine_id, req.auth_token)
+
+    # 2. Transform and forecast each metric on the forecast pool
+    try:
+        results = await asyncio.gather(*[
+            forecast_pool.forecast(
+                prepare_columns(*daily_records_to_columns(daily_records, metric)),
+                req.days_to_forecast,
+                series_key=f"{req.centre_vaccine_id}:{metric}",
+                model=req.model,
+            )
+            for metric in metrics
+        ])
+    except ForecastQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        print(f"Internal Forecasting Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal forecasting failed after data transformation: {str(e)}")
+
+    return dict(zip(metrics, results))
+
+# --- New API Endpoints (UPDATED) ---
+
+@router.post("/forecast_demand", response_model=ForecastResponse)
+async def forecast_demand_endpoint(req: DemandForecastRequest):
+    """
+    Fetches historical usage data for a specific vaccine at a center from an external API,
+    transforms it, and then uses the Prophet model to predict future demand (doses used).
+    """
+    results = await forecast_metrics(req, ["used"])
+    return results["used"]
+
+
+@router.post("/forecast_waste", response_model=ForecastResponse)
+async def forecast_waste_endpoint(req: DemandForecastRequest):
+    """
+    Fetches historical usage data for a specific vaccine at a center from an external API,
+    transforms it, and then uses the Prophet model to predict future waste (doses wasted).
+    """
+    results = await forecast_metrics(req, ["wasted"])
+    return results["wasted"]
+
+
+@router.post("/forecast_usage", response_model=UsageForecastResponse)
+async def forecast_usage_endpoint(req: DemandForecastRequest):
+    """
+    Demand and waste forecasts for one vaccine at a center in a single call:
+    the daily series is fetched once and both metrics are fitted from it in parallel.
+    """
+    results = await forecast_metrics(req, ["used", "wasted"])
+    return {"demand": results["used"], "waste": results["wasted"]}
+
+
+class BatchForecastRequest(BaseModel):
+    centre_vaccine_ids: List[str] = Field(..., min_length=1, max_length=1000, example=["690e473c078a4481e3c69863"])
+    metric: Literal["used", "wasted"] = Field("used", description="Forecast doses used (demand) or doses wasted")
+    days_to_forecast: int = Field(..., ge=1, le=365, example=30)
+    auth_token: str = Field(..., example="Bearer abc123xyz789", description="Authorization token for the external historical API.")
+    fresh: bool = Field(False, description="Skip the nightly precomputed forecasts and fit on live data.")
+    model: ForecastModel = Field("auto", description="Forecasting engine; anything but 'auto' always fits on live data")
+
+
+@router.post("/forecast_batch")
+async def forecast_batch_endpoint(req: BatchForecastRequest):
+    """
+    Forecasts many centre_vaccine_ids in one call.
+    Histories are fetched concurrently, fits run in parallel on the forecast pool, and each
+    result is streamed back as one NDJSON line as soon as its series finishes.
+    """
+    ids = list(dict.fromkeys(req.centre_vaccine_ids))  # drop duplicate ids, keep order
+
+    fetch_limit = asyncio.Semaphore(BATCH_FETCH_CONCURRENCY)
+
+    async def forecast_one(centre_vaccine_id: str) -> Dict[str, Any]:
+        line = {"centre_vaccine_id": centre_vaccine_id, "metric": req.metric}
+        if not req.fresh and req.model == "auto":
+            stored = stored_forecasts(centre_vaccine_id, req.auth_token, [req.metric], req.days_to_forecast)
+            if stored is not None:
+                line.update(status="ok", forecast=stored[req.metric])
+                return line
+        try:
+            async with fetch_limit:
+                daily_records = await fetch_daily_usage_cached(centre_vaccine_id, req.auth_token)
+            df = prepare_columns(*daily_records_to_columns(daily_records, req.metric))
+            async with forecast_pool.batch_slots:
+                line["forecast"] = await forecast_pool.forecast(
+                    df, req.days_to_forecast, series_key=f"{centre_vaccine_id}:{req.metric}", model=req.model
+                )
+            line["status"] = "ok"
+        except HTTPException as e:
+            line.update(status="error", status_code=e.status_code, detail=e.detail)
+        except ForecastQueueFull as e:
+            # Single-series requests filled the queue meanwhile; same 503 they would get, retry this id later
+            line.update(status="error", status_code=503, detail=str(e), retryable=True)
+        except Exception as e:
+            print(f"Batch Forecasting Error ({centre_vaccine_id}): {e}")
+            line.update(status="error", status_code=500, detail=f"Model forecasting failed: {str(e)}")
+        return line
+
+    async def stream_results():
+        tasks = [asyncio.create_task(forecast_one(cv_id)) for cv_id in ids]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client disconnected mid-stream: stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
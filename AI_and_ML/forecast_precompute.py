@@ -0,0 +1,150 @@
+"""
+Nightly forecast precompute.
+
+Runs the regular fetch -> prepare_columns -> Prophet pipeline for every known centre_vaccine_id
+and both metrics, and writes full-horizon results to the forecast store that /forecast_demand,
+/forecast_waste and /forecast_usage answer from.
+
+    # ids discovered through the backend with an authority token ("<JWT>" or "Bearer <JWT>")
+    python forecast_precompute.py --token "<authority JWT>"
+
+    # or an explicit id list (one per line)
+    python forecast_precompute.py --token "<JWT>" --ids-file centre_vaccine_ids.txt
+
+Schedule it with cron, or set FORECAST_PRECOMPUTE_AT=HH:MM to let the API process run it itself.
+"""
+import os
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from auth_utils import bearer_header
+from backend_client import daily_records_to_columns, fetch_daily_payload, get_backend_client, close_backend_client
+from forecast_store import FORECAST_STORE_HORIZON, ForecastStore
+from forecasting import ForecastPool, prepare_columns
+
+FORECAST_PRECOMPUTE_TOKEN = os.getenv("FORECAST_PRECOMPUTE_TOKEN")
+FORECAST_PRECOMPUTE_AT = os.getenv("FORECAST_PRECOMPUTE_AT")  # e.g. "02:00", local time; unset = no in-app schedule
+FORECAST_PRECOMPUTE_FETCH_CONCURRENCY = int(os.getenv("FORECAST_PRECOMPUTE_FETCH_CONCURRENCY", "8"))
+
+
+async def discover_centre_vaccine_ids(auth_token: str) -> List[str]:
+    """Lists every centre (authority only) and collects the centre_vaccine ids assigned to each."""
+    client = get_backend_client()
+    headers = {"Authorization": auth_token, "Accept": "application/json"}
+
+    response = await client.get("/api/vacc_centre/", headers=headers)
+    response.raise_for_status()
+    centres = response.json()
+
+    async def assigned(vc_id: str) -> List[str]:
+        r = await client.get(f"/api/centre_vaccine/assigned/{vc_id}", headers=headers)
+        r.raise_for_status()
+        return [item["centre_vaccine_id"] for item in r.json()]
+
+    per_centre = await asyncio.gather(*[assigned(c["vc_id"]) for c in centres if c.get("vc_id")])
+    return list(dict.fromkeys(cv_id for ids in per_centre for cv_id in ids))
+
+
+async def precompute_all(
+    centre_vaccine_ids: List[str],
+    auth_token: str,
+    store: ForecastStore,
+    pool: ForecastPool,
+    horizon: int = FORECAST_STORE_HORIZON,
+    metrics: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Forecasts every id/metric on the pool and writes the results to the store."""
+    metrics = metrics or ["used", "wasted"]
+    fetch_limit = asyncio.Semaphore(FORECAST_PRECOMPUTE_FETCH_CONCURRENCY)
+    fit_limit = asyncio.Semaphore(max(1, pool.workers))
+    summary: Dict[str, Any] = {"series_ok": 0, "series_failed": 0, "errors": {}}
+
+    async def one(centre_vaccine_id: str) -> None:
+        try:
+            async with fetch_limit:
+                payload = await fetch_daily_payload(centre_vaccine_id, auth_token)
+            daily_records = payload.get("daily") or []
+            if not daily_records:
+                raise HTTPException(status_code=404, detail="no historical usage data")
+        except HTTPException as e:
+            summary["series_failed"] += len(metrics)
+            summary["errors"][centre_vaccine_id] = e.detail
+            return
+
+        for metric in metrics:
+            try:
+                df = prepare_columns(*daily_records_to_columns(daily_records, metric))
+                async with fit_limit:
+                    forecast = await pool.forecast(df, horizon, series_key=f"{centre_vaccine_id}:{metric}")
+                store.put(centre_vaccine_id, metric, payload.get("centre_id"), forecast)
+                summary["series_ok"] += 1
+            except Exception as e:
+                summary["series_failed"] += 1
+                summary["errors"][f"{centre_vaccine_id}:{metric}"] = str(e)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(cv_id) for cv_id in centre_vaccine_ids])
+    summary["seconds"] = round(time.perf_counter() - started, 1)
+    summary["ids"] = len(centre_vaccine_ids)
+    return summary
+
+
+def _seconds_until(hh_mm: str) -> float:
+    hour, minute = (int(x) for x in hh_mm.split(":"))
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+async def nightly_precompute_loop(store: ForecastStore, pool: ForecastPool, run_at: str, auth_token: str) -> None:
+    """In-process scheduler (started from the API lifespan when FORECAST_PRECOMPUTE_AT is set)."""
+    auth_token = bearer_header(auth_token)
+    while True:
+        await asyncio.sleep(_seconds_until(run_at))
+        try:
+            ids = await discover_centre_vaccine_ids(auth_token)
+            summary = await precompute_all(ids, auth_token, store, pool)
+            print(f"Forecast precompute finished: {summary['series_ok']} ok, {summary['series_failed']} failed in {summary['seconds']}s")
+        except Exception as e:
+            print(f"Forecast precompute failed: {e}")
+
+
+async def _main(args) -> None:
+    if not args.token:
+        raise SystemExit("A backend token is required (--token or FORECAST_PRECOMPUTE_TOKEN).")
+    auth_token = bearer_header(args.token)
+
+    pool = ForecastPool()
+    pool.start()
+    try:
+        if args.ids_file:
+            with open(args.ids_file) as f:
+                ids = [line.strip() for line in f if line.strip()]
+        else:
+            ids = await discover_centre_vaccine_ids(auth_token)
+        print(f"Precomputing {len(ids)} centre_vaccine ids x {len(args.metrics)} metrics, horizon {args.horizon} days...")
+
+        summary = await precompute_all(ids, auth_token, ForecastStore(args.store), pool, args.horizon, args.metrics)
+        print(f"Done: {summary['series_ok']} ok, {summary['series_failed']} failed in {summary['seconds']}s")
+        for key, error in summary["errors"].items():
+            print(f"  {key}: {error}")
+    finally:
+        pool.shutdown()
+        await close_backend_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token", default=FORECAST_PRECOMPUTE_TOKEN, help="Backend JWT, with or without the 'Bearer ' prefix")
+    parser.add_argument("--ids-file", help="File with one centre_vaccine_id per line (default: discover via backend)")
+    parser.add_argument("--store", default=ForecastStore().path)
+    parser.add_argument("--horizon", type=int, default=FORECAST_STORE_HORIZON)
+    parser.add_argument("--metrics", nargs="+", choices=["used", "wasted"], default=["used", "wasted"])
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from cache_utils import SQLiteConnections
+
+# Precomputed forecasts written by the nightly job (forecast_precompute.py) and read by the forecast endpoints
+FORECAST_STORE_PATH = os.getenv("FORECAST_STORE_PATH", "forecast_store.sqlite3")
+FORECAST_STORE_HORIZON = int(os.getenv("FORECAST_STORE_HORIZON", "365"))
+# Rows older than this are ignored and the request falls through to a live forecast
+FORECAST_STORE_MAX_AGE_HOURS = float(os.getenv("FORECAST_STORE_MAX_AGE_HOURS", "36"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    centre_vaccine_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    centre_id TEXT,
+    horizon INTEGER NOT NULL,
+    computed_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (centre_vaccine_id, metric)
+)
+"""
+
+
+class ForecastStore:
+    """
+    SQLite table of full-horizon forecasts, one row per (centre_vaccine_id, metric).
+
+    The payload is stored column-wise (dates / predicted / lower / upper arrays) so a
+    shorter horizon is a slice, not a recompute.
+    """
+
+    def __init__(self, path: str = FORECAST_STORE_PATH):
+        self.path = path
+        self._db = SQLiteConnections(path, _SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, centre_vaccine_id: str, metric: str, centre_id: Optional[str], forecast: Dict[str, Any]) -> None:
+        rows = forecast["daily_forecast"]
+        payload = {
+            "dates": [r["date"] for r in rows],
+            "predicted": [r["predicted_usage"] for r in rows],
+            "lower": [r["lower_bound"] for r in rows],
+            "upper": [r["upper_bound"] for r in rows],
+        }
+        conn = self._db.connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?)",
+                (centre_vaccine_id, metric, centre_id, len(rows), time.time(), json.dumps(payload, separators=(",", ":"))),
+            )
+
+    def get(
+        self,
+        centre_vaccine_id: str,
+        metric: str,
+        n_days: int,
+        max_age_hours: float = FORECAST_STORE_MAX_AGE_HOURS,
+    ) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        """Returns (centre_id, ForecastResponse-shaped dict) or None if missing, stale or too short."""
+        row = self._db.connection().execute(
+            "SELECT centre_id, horizon, computed_at, payload FROM forecasts WHERE centre_vaccine_id = ? AND metric = ?",
+            (centre_vaccine_id, metric),
+        ).fetchone()
+        if row is None or row[1] < n_days or time.time() - row[2] > max_age_hours * 3600:
+            self.misses += 1
+            return None
+
+        centre_id, _, _, payload = row
+        cols = json.loads(payload)
+        predicted = cols["predicted"][:n_days]
+        daily = [
+            {"date": d, "predicted_usage": p, "lower_bound": lo, "upper_bound": up}
+            for d, p, lo, up in zip(cols["dates"][:n_days], predicted, cols["lower"][:n_days], cols["upper"][:n_days])
+        ]
+        self.hits += 1
+        return centre_id, {
+            "forecast_total": round(sum(predicted), 2),
+            "days_forecasted": n_days,
+            "daily_forecast": daily,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        count, oldest, newest = self._db.connection().execute(
+            "SELECT COUNT(*), MIN(computed_at), MAX(computed_at) FROM forecasts"
+        ).fetchone()
+        return {
+            "path": self.path,
+            "rows": count,
+            "oldest_computed_at": oldest,
+            "newest_computed_at": newest,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,543 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import functools
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from cache_utils import LRUCache
+from metrics import collect_stages, record_stages, stage
+
+# Kept free of Gemini/Pinecone imports on purpose: worker processes import this module directly.
+
+# Setup basic logging
+logging.getLogger("prophet").setLevel(logging.WARNING)
+logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+# Fitted-model cache settings (a fit costs seconds of Stan optimization, a lookup costs microseconds)
+FORECAST_CACHE_MAX_MODELS = int(os.getenv("FORECAST_CACHE_MAX_MODELS", "256"))
+FORECAST_CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "3600"))
+FORECAST_CACHE_MAX_MB = float(os.getenv("FORECAST_CACHE_MAX_MB", "256"))
+
+# Worker pool settings. FORECAST_WORKERS=0 runs fits on a single background thread instead of processes.
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(min(4, os.cpu_count() or 1))))
+FORECAST_MAX_QUEUE = int(os.getenv("FORECAST_MAX_QUEUE", "32"))
+FORECAST_MP_START = os.getenv("FORECAST_MP_START", "spawn")
+
+# Warm-start settings: a series whose history only moved forward by a few days starts Stan from its last fit.
+# Off by default: on the backend's 100-day /daily window the fit is already ~30 ms and warm starts save almost
+# nothing (benchmarks/bench_warm_start.py); they pay off on multi-year histories (~1.3x at 1095 days).
+FORECAST_WARM_START = os.getenv("FORECAST_WARM_START", "false").lower() == "true"
+FORECAST_WARM_START_MAX_NEW_DAYS = int(os.getenv("FORECAST_WARM_START_MAX_NEW_DAYS", "14"))
+FORECAST_WARM_START_MAX_SERIES = int(os.getenv("FORECAST_WARM_START_MAX_SERIES", "10000"))
+
+# Histories observed for fewer days than this (leading zero days not counted) go to Holt-Winters when model="auto"
+FORECAST_SHORT_HISTORY_DAYS = int(os.getenv("FORECAST_SHORT_HISTORY_DAYS", "30"))
+HW_ALPHA = float(os.getenv("HW_ALPHA", "0.3"))
+HW_BETA = float(os.getenv("HW_BETA", "0.05"))
+HW_GAMMA = float(os.getenv("HW_GAMMA", "0.2"))
+HW_PHI = float(os.getenv("HW_PHI", "0.98"))  # trend damping, keeps long horizons from running away
+INTERVAL_Z = 1.2816  # two-sided 80% interval, Prophet's default interval_width
+
+
+# --- 1. Fitted-Model Cache ---
+
+class FittedModel:
+    """A fitted Prophet model plus the longest forecast we have predicted with it so far."""
+
+    def __init__(self, model: Prophet):
+        self.model = model
+        self.forecast: Optional[pd.DataFrame] = None
+        self.horizon = 0
+
+
+def _fitted_model_size(entry: FittedModel) -> int:
+    # Rough footprint: training frame + parameter arrays + cached forecast frame
+    size = 64 * 1024  # fixed overhead of the Prophet object itself
+    history_df = getattr(entry.model, "history", None)
+    if history_df is not None:
+        size += int(history_df.memory_usage(deep=True).sum())
+    for value in (entry.model.params or {}).values():
+        size += getattr(value, "nbytes", 0)
+    if entry.forecast is not None:
+        size += int(entry.forecast.memory_usage(deep=True).sum())
+    return size
+
+
+# One cache per process: with the process pool each worker owns the models it fitted
+fitted_model_cache = LRUCache(
+    max_entries=FORECAST_CACHE_MAX_MODELS,
+    ttl_seconds=FORECAST_CACHE_TTL_SECONDS,
+    max_bytes=int(FORECAST_CACHE_MAX_MB * 1024 * 1024),
+    sizeof=_fitted_model_size,
+)
+
+
+class WarmStart:
+    """Last fitted Stan parameters of one series, with enough context to tell if they still apply."""
+
+    def __init__(self, settings: Dict[str, Any], last_ds: pd.Timestamp, init: Dict[str, Any]):
+        self.settings = settings
+        self.last_ds = last_ds
+        self.init = init
+
+
+# series_key -> WarmStart. Only a few dozen floats per series, so this can hold thousands.
+warm_start_store = LRUCache(max_entries=FORECAST_WARM_START_MAX_SERIES)
+fit_counters = {"cold_fits": 0, "warm_fits": 0}
+
+
+def cache_stats() -> Dict[str, Any]:
+    stats = fitted_model_cache.stats()
+    stats.update(fit_counters)
+    stats["warm_start_series"] = len(warm_start_store)
+    return stats
+
+
+# --- 2. Forecasting Logic ---
+
+def _clean_history(df: pd.DataFrame) -> pd.DataFrame:
+    # Remove any potential duplicates or NaNs that might crash Prophet
+    return df.dropna().drop_duplicates(subset='ds').sort_values(by='ds')
+
+
+def prepare_history(history: List[Any]) -> pd.DataFrame:
+    """Builds the cleaned ds/y frame Prophet expects from DataPoint objects (or plain dicts)."""
+    with stage("dataframe_prep"):
+        # Prophet specifically requires columns named 'ds' (Date) and 'y' (Target Value)
+        df = pd.DataFrame([item.model_dump() if hasattr(item, "model_dump") else item for item in history])
+        df.rename(columns={'date': 'ds', 'amphules_used': 'y'}, inplace=True)
+        df['ds'] = pd.to_datetime(df['ds'])
+        return _clean_history(df)
+
+
+def _parse_dates(dates: Sequence[Any]) -> np.ndarray:
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates
+    try:
+        # ISO dates (what the backend and the columnar request send) parse ~2x faster than with format inference
+        return pd.to_datetime(dates, format='ISO8601').to_numpy()
+    except ValueError:
+        return pd.to_datetime(pd.Series(dates)).to_numpy()
+
+
+def prepare_columns(dates: Sequence[Any], values: Sequence[Any]) -> pd.DataFrame:
+    """
+    Same ds/y frame as prepare_history, from parallel date and value columns: no object or dict
+    per point, so long histories cost a couple of array conversions instead of a per-row loop.
+    """
+    if len(dates) != len(values):
+        raise ValueError(f"dates and values differ in length ({len(dates)} vs {len(values)}).")
+    with stage("dataframe_prep"):
+        df = pd.DataFrame({'ds': _parse_dates(dates), 'y': np.asarray(values, dtype='float64')})
+        return _clean_history(df)
+
+
+def prepare_arrow(body: bytes) -> pd.DataFrame:
+    """
+    ds/y frame from an Arrow IPC stream with a `date` column (date32/timestamp, or YYYY-MM-DD strings)
+    and an `amphules_used` column. Needs pyarrow, which is only imported here.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    dates = table.column('date')
+    if pa.types.is_string(dates.type) or pa.types.is_large_string(dates.type):
+        dates = pc.strptime(dates, format='%Y-%m-%d', unit='s')
+    elif pa.types.is_date(dates.type):
+        dates = dates.cast(pa.timestamp('s'))
+    # Nulls come out as NaT/NaN and are dropped with the other unusable points
+    return prepare_columns(
+        dates.to_numpy(),
+        table.column('amphules_used').cast(pa.float64()).to_numpy(),
+    )
+
+
+def model_settings(df: pd.DataFrame) -> Dict[str, Any]:
+    # We enable daily_seasonality if data is granular enough, otherwise Prophet handles weekly/yearly automatically
+    return {"daily_seasonality": True if len(df) > 90 else False}
+
+
+def history_fingerprint(df: pd.DataFrame, settings: Dict[str, Any]) -> str:
+    """Hashes the cleaned ds/y frame together with the model settings."""
+    h = hashlib.sha256()
+    h.update(df['ds'].to_numpy(dtype='datetime64[ns]').view('int64').tobytes())
+    h.update(df['y'].to_numpy(dtype='float64').tobytes())
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def warm_start_params(m: Prophet) -> Dict[str, Any]:
+    """Point estimates of a MAP fit in the shape Prophet.fit(init=...) expects."""
+    res = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        res[pname] = float(m.params[pname][0][0])
+    for pname in ['delta', 'beta']:
+        res[pname] = m.params[pname][0]
+    return res
+
+
+def _warm_start_init(series_key: Optional[str], df: pd.DataFrame, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Returns the previous fit's parameters if the history only grew by a short tail since then."""
+    if not FORECAST_WARM_START or series_key is None:
+        return None
+    previous = warm_start_store.get(series_key)
+    if previous is None or previous.settings != settings:
+        return None
+    new_days = (df['ds'].iloc[-1] - previous.last_ds).days
+    if new_days < 0 or new_days > FORECAST_WARM_START_MAX_NEW_DAYS:
+        return None
+    return previous.init
+
+
+def fit_prophet(df: pd.DataFrame, settings: Dict[str, Any], series_key: Optional[str] = None) -> Prophet:
+    """Fits Prophet, warm-starting Stan from the series' last parameters when they still apply."""
+    init = _warm_start_init(series_key, df, settings)
+    m = Prophet(**settings)
+    if init is not None:
+        try:
+            # Prophet checks the init shapes (changepoints, seasonal features) and falls back to defaults if they changed
+            with stage("fit"):
+                m.fit(df, init=init)
+            fit_counters["warm_fits"] += 1
+        except Exception as e:
+            print(f"Warm-start fit failed for {series_key}, refitting cold: {e}")
+            init = None
+            m = Prophet(**settings)
+    if init is None:
+        with stage("fit"):
+            m.fit(df)
+        fit_counters["cold_fits"] += 1
+
+    if series_key is not None:
+        warm_start_store.set(series_key, WarmStart(settings, df['ds'].iloc[-1], warm_start_params(m)))
+    return m
+
+
+# --- 3. Forecaster Engines ---
+
+class Forecaster(ABC):
+    """
+    Engine interface. predict() returns the next n_days after a prepared ds/y frame as columns
+    ds, yhat, yhat_lower and yhat_upper (a DataFrame or a dict of NumPy arrays);
+    format_forecast turns them into the response.
+    """
+
+    name = ""
+    # Cheap engines run on the event loop; expensive ones are sent to the worker pool
+    runs_inline = False
+
+    @abstractmethod
+    def predict(
+        self,
+        df: pd.DataFrame,
+        n_days: int,
+        settings: Dict[str, Any],
+        cache_key: str,
+        series_key: Optional[str] = None,
+    ) -> Any:
+        ...
+
+
+class ProphetForecaster(Forecaster):
+    name = "prophet"
+
+    def predict(self, df, n_days, settings, cache_key, series_key=None):
+        # 1. Initialize and Fit Prophet Model (or reuse a cached fit of the same history)
+        entry = fitted_model_cache.get(cache_key)
+        if entry is None:
+            # fit the model
+            m = fit_prophet(df, settings, series_key)
+            entry = FittedModel(m)
+
+        # 2. Predict, reusing the cached forecast when it already covers the requested horizon
+        if entry.forecast is None or entry.horizon < n_days:
+            future = entry.model.make_future_dataframe(periods=n_days, freq='D')
+            with stage("predict"):
+                entry.forecast = entry.model.predict(future)
+            entry.horizon = n_days
+            # Re-store so the memory estimate includes the new forecast frame
+            fitted_model_cache.set(cache_key, entry)
+
+        # 3. Extract only the future N days
+        forecast = entry.forecast
+        return forecast.iloc[len(forecast) - entry.horizon:].head(n_days)
+
+
+class HoltWintersForecaster(Forecaster):
+    """
+    Additive Holt-Winters with a damped trend and weekly seasonality, in plain Python/NumPy.
+    A single pass over the history, so it fits short series in microseconds.
+    """
+
+    name = "holt_winters"
+    runs_inline = True
+
+    def __init__(self, season: int = 7, alpha: float = HW_ALPHA, beta: float = HW_BETA, gamma: float = HW_GAMMA, phi: float = HW_PHI):
+        self.season = season
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+
+    def predict(self, df, n_days, settings, cache_key, series_key=None):
+        with stage("fit"):
+            # One value per calendar day; interpolate any gaps so the weekly index stays aligned.
+            # Plain NumPy throughout: pandas resampling alone would cost more than the whole fit.
+            days = df['ds'].to_numpy(dtype='datetime64[D]')
+            values = df['y'].to_numpy(dtype='float64')
+            span = int((days[-1] - days[0]).astype(int)) + 1
+            if span != len(values):
+                offsets = (days - days[0]).astype(int)
+                values = np.interp(np.arange(span), offsets, values)
+            y = values.tolist()  # Python floats: much faster than NumPy scalars in the loop
+            n, m = len(y), self.season
+            alpha, beta, phi = self.alpha, self.beta, self.phi
+
+            # Initial state: first season's mean/offsets if we have two full seasons, else level + slope only
+            if n >= 2 * m:
+                level = sum(y[:m]) / m
+                trend = (sum(y[m:2 * m]) / m - level) / m
+                seasonal = [v - level for v in y[:m]]
+                gamma = self.gamma
+            else:
+                level = y[0]
+                trend = (y[-1] - y[0]) / (n - 1) if n > 1 else 0.0
+                seasonal = [0.0] * m
+                gamma = 0.0
+
+            residuals = []
+            for t, value in enumerate(y):
+                s = seasonal[t % m]
+                residuals.append(value - (level + phi * trend + s))
+                prev_level = level
+                level = alpha * (value - s) + (1 - alpha) * (level + phi * trend)
+                trend = beta * (level - prev_level) + (1 - beta) * phi * trend
+                seasonal[t % m] = gamma * (value - level) + (1 - gamma) * s
+
+        with stage("predict"):
+            h = np.arange(1, n_days + 1)
+            damped = phi * (1 - phi ** h) / (1 - phi) if phi < 1 else h.astype('float64')
+            yhat = level + damped * trend + np.asarray(seasonal)[(n + h - 1) % m]
+
+            # Same 80% interval Prophet reports by default, widening with the horizon
+            fit_residuals = residuals[m:] if n > 2 * m else residuals
+            sigma = float(np.std(fit_residuals)) if fit_residuals else 0.0
+            width = INTERVAL_Z * sigma * np.sqrt(h)
+
+        return {
+            'ds': days[-1] + h,
+            'yhat': yhat,
+            'yhat_lower': yhat - width,
+            'yhat_upper': yhat + width,
+        }
+
+
+FORECASTERS: Dict[str, Forecaster] = {f.name: f for f in (ProphetForecaster(), HoltWintersForecaster())}
+
+
+def observed_span_days(df: pd.DataFrame) -> int:
+    """
+    Days from the first non-zero value to the end of the history. The backend's /daily route zero-fills
+    a fixed 100-day window, so a new centre's leading zeros are days without data, not observations.
+    """
+    nonzero = np.flatnonzero(df['y'].to_numpy() != 0)
+    if len(nonzero) == 0:
+        return 0
+    return int((df['ds'].iloc[-1] - df['ds'].iloc[nonzero[0]]).days) + 1
+
+
+def select_forecaster(df: pd.DataFrame, model: str = "auto") -> Forecaster:
+    """'auto' uses the cheap engine for short histories, where Prophet's fit cost buys little accuracy."""
+    if model == "auto":
+        model = "holt_winters" if observed_span_days(df) < FORECAST_SHORT_HISTORY_DAYS else "prophet"
+    return FORECASTERS[model]
+
+
+def fit_and_forecast(
+    df: pd.DataFrame,
+    n_days: int,
+    settings: Dict[str, Any],
+    cache_key: str,
+    series_key: Optional[str] = None,
+    model: str = "prophet",
+) -> Dict[str, Any]:
+    """Fits (or reuses) a model for a prepared frame and formats the next n_days."""
+    future_forecast = FORECASTERS[model].predict(df, n_days, settings, cache_key, series_key)
+
+    # Format Results
+    with stage("format"):
+        return format_forecast(future_forecast, n_days)
+
+
+def format_forecast(future_forecast: Any, n_days: int) -> Dict[str, Any]:
+    """
+    Builds the ForecastResponse payload column-wise (no per-row iterrows/round/strftime).
+    Accepts a DataFrame or a dict of arrays with ds, yhat, yhat_lower and yhat_upper.
+    """
+    # Ensure non-negative predictions for physical goods like amphules; "+ 0.0" turns -0.0 into 0.0
+    predicted = np.maximum(np.round(np.asarray(future_forecast['yhat'], dtype='float64'), 2), 0.0) + 0.0
+    lower = np.maximum(np.round(np.asarray(future_forecast['yhat_lower'], dtype='float64'), 2), 0.0) + 0.0
+    upper = np.maximum(np.round(np.asarray(future_forecast['yhat_upper'], dtype='float64'), 2), 0.0) + 0.0
+    dates = np.datetime_as_string(np.asarray(future_forecast['ds'], dtype='datetime64[D]'), unit='D')
+
+    results = [
+        {"date": d, "predicted_usage": p, "lower_bound": lo, "upper_bound": up}
+        for d, p, lo, up in zip(dates.tolist(), predicted.tolist(), lower.tolist(), upper.tolist())
+    ]
+
+    return {
+        "forecast_total": round(float(predicted.sum()), 2),
+        "days_forecasted": n_days,
+        "daily_forecast": results
+    }
+
+
+def run_prophet_model(history: List[Any], n_days: int, model: str = "prophet") -> Dict[str, Any]:
+    """Runs the whole pipeline in the current process (blocking)."""
+    df = prepare_history(history)
+    settings = model_settings(df)
+    return fit_and_forecast(df, n_days, settings, history_fingerprint(df, settings), model=model)
+
+
+# --- 4. Worker Pool ---
+
+def warm_worker() -> None:
+    """Process initializer: loads Prophet/cmdstanpy and runs one tiny fit so the first real request is not cold."""
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    try:
+        df = pd.DataFrame({
+            "ds": pd.date_range("2024-01-01", periods=14, freq="D"),
+            "y": [float(i % 7) for i in range(14)],
+        })
+        Prophet().fit(df)
+    except Exception as e:
+        print(f"Forecast worker warm-up failed: {e}")
+
+
+def _ping() -> bool:
+    return True
+
+
+class ForecastQueueFull(Exception):
+    pass
+
+
+class ForecastPool:
+    """
+    Runs forecasts off the event loop.
+
+    Each worker is its own single-process executor and work is routed by key, so
+    repeat requests for the same history (or the same series) land on the worker
+    that already holds the fitted model and warm-start parameters.
+    """
+
+    def __init__(self, workers: int = FORECAST_WORKERS, max_queue: int = FORECAST_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        # Shared by every /forecast_batch request: together they never hand the pool more fits than it has
+        # workers, so concurrent batches cannot trip the max_queue limit that single-series requests rely on
+        self.batch_slots = asyncio.Semaphore(max(1, workers))
+        self._shards: List[Executor] = []
+
+    def _new_shard(self) -> Executor:
+        if self.workers <= 0:
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="forecast")
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context(FORECAST_MP_START),
+            initializer=warm_worker,
+        )
+
+    def start(self) -> None:
+        if self._shards:
+            return
+        self._shards = [self._new_shard() for _ in range(max(1, self.workers))]
+        if self.workers > 0:
+            # Spawn the processes now so the warm-up happens at startup, not on the first request
+            for shard in self._shards:
+                shard.submit(_ping)
+
+    def shutdown(self) -> None:
+        for shard in self._shards:
+            shard.shutdown(wait=False, cancel_futures=True)
+        self._shards = []
+
+    def _shard_index(self, key: str) -> int:
+        digest = hashlib.md5(key.encode()).hexdigest()
+        return int(digest[:8], 16) % len(self._shards)
+
+    async def run(self, key: str, fn, *args) -> Any:
+        """Runs fn(*args) on the worker owning `key`; raises ForecastQueueFull past max_queue."""
+        if self.in_flight >= self.max_queue:
+            raise ForecastQueueFull(f"Forecast queue is full ({self.in_flight} jobs in flight). Try again shortly.")
+        self.start()
+
+        idx = self._shard_index(key)
+        shard = self._shards[idx]
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(shard, functools.partial(fn, *args))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM during a fit); replace it so later requests recover.
+            # Every job queued on that shard fails the same way: only the first of them swaps it.
+            if self._shards[idx] is shard:
+                shard.shutdown(wait=False, cancel_futures=True)
+                self._shards[idx] = self._new_shard()
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def forecast(
+        self,
+        df: pd.DataFrame,
+        n_days: int,
+        series_key: Optional[str] = None,
+        model: str = "auto",
+    ) -> Dict[str, Any]:
+        """
+        series_key (e.g. "<centre_vaccine_id>:used") identifies a series across days for warm-starting.
+        model is "auto", "prophet" or "holt_winters".
+        """
+        if df.empty:
+            raise ValueError("No usable history points after cleaning.")
+        forecaster = select_forecaster(df, model)
+        settings = model_settings(df)
+        if forecaster.runs_inline:
+            # Cheaper than the round-trip to a worker process
+            return fit_and_forecast(df, n_days, settings, "", series_key, forecaster.name)
+
+        cache_key = history_fingerprint(df, settings)
+        # The fit/predict/format timings come back from the worker with the result
+        result, timings = await self.run(
+            series_key or cache_key, collect_stages, fit_and_forecast, df, n_days, settings, cache_key, series_key, forecaster.name
+        )
+        record_stages(timings)
+        return result
+
+    async def stats(self) -> Dict[str, Any]:
+        """Sums the fitted-model cache counters across workers."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        per_worker = await asyncio.gather(*[loop.run_in_executor(shard, cache_stats) for shard in self._shards])
+
+        totals: Dict[str, Any] = {"workers": self.workers, "in_flight": self.in_flight, "max_queue": self.max_queue}
+        for field in ("entries", "bytes", "hits", "misses", "evictions", "cold_fits", "warm_fits", "warm_start_series"):
+            totals[field] = sum(s[field] for s in per_worker)
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        totals["per_worker"] = per_worker
+        return totals
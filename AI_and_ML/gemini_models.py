@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+# Explicit Gemini context caching of each persona's static prompt (system instruction + tool schemas).
+# Gemini only caches prompts above a minimum size (1024 tokens on 2.5 Flash); a persona whose cache
+# cannot be created keeps using the plain model.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CONTEXT_CACHE_TTL_MINUTES = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", "60"))
+
+
+class PersonaModels:
+    """
+    One GenerativeModel per chat persona, built once and shared by every request. A model holds no
+    conversation state (start_chat() creates the session), so sharing it is safe; per request only
+    the history replay is left.
+
+    personas maps a name to {"system_instruction", "tools", ...}. Also counts setup time and the
+    prompt/cached/output tokens Gemini reports per persona.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        personas: Dict[str, Dict[str, Any]],
+        context_cache: bool = GEMINI_CONTEXT_CACHE,
+        cache_ttl_minutes: int = GEMINI_CONTEXT_CACHE_TTL_MINUTES,
+    ):
+        self.model_name = model_name
+        self.personas = personas
+        self.context_cache = context_cache
+        self.cache_ttl = timedelta(minutes=cache_ttl_minutes)
+
+        self._lock = threading.Lock()
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._caches: Dict[str, caching.CachedContent] = {}
+        self._stats = {
+            name: {"builds": 0, "build_ms": 0.0, "turns": 0, "setup_ms": 0.0,
+                   "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+            for name in personas
+        }
+
+    def _build(self, persona: str) -> genai.GenerativeModel:
+        config = self.personas[persona]
+        started = time.perf_counter()
+        model = None
+        if self.context_cache:
+            try:
+                cache = caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    display_name=f"vaccine-{persona}",
+                    system_instruction=config["system_instruction"],
+                    tools=config["tools"],
+                    ttl=self.cache_ttl,
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cache)
+                self._caches[persona] = cache
+            except Exception as e:
+                print(f"Context cache unavailable for '{persona}', using the plain model: {e}")
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name=self.model_name,
+                tools=config["tools"],
+                system_instruction=config["system_instruction"]
+            )
+
+        stats = self._stats[persona]
+        stats["builds"] += 1
+        stats["build_ms"] += 1000 * (time.perf_counter() - started)
+        return model
+
+    def get(self, persona: str) -> genai.GenerativeModel:
+        with self._lock:
+            model = self._models.get(persona)
+            if model is None:
+                model = self._models[persona] = self._build(persona)
+            return model
+
+    def build_all(self) -> None:
+        """Builds every persona up front (at startup), so no request pays for it."""
+        for persona in self.personas:
+            self.get(persona)
+
+    def refresh_caches(self) -> None:
+        """Pushes the context caches' expiry forward; a cache that cannot be extended is re-created."""
+        for persona, cache in list(self._caches.items()):
+            try:
+                cache.update(ttl=self.cache_ttl)
+            except Exception as e:
+                print(f"Context cache refresh failed for '{persona}', re-creating it: {e}")
+                with self._lock:
+                    self._caches.pop(persona, None)
+                    self._models[persona] = self._build(persona)
+
+    def close(self) -> None:
+        """Deletes the context caches (they are billed per hour of storage until they expire)."""
+        for cache in self._caches.values():
+            try:
+                cache.delete()
+            except Exception as e:
+                print(f"Context cache delete failed: {e}")
+        self._caches.clear()
+
+    def record_setup(self, persona: str, seconds: float) -> None:
+        stats = self._stats[persona]
+        stats["turns"] += 1
+        stats["setup_ms"] += 1000 * seconds
+
+    def record_usage(self, persona: str, response) -> None:
+        """Adds the token counts of one generate call (usage_metadata) to the persona's totals."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        stats = self._stats[persona]
+        stats["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+        stats["cached_tokens"] += getattr(usage, "cached_content_token_count", 0) or 0
+        stats["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"model": self.model_name, "context_cache": self.context_cache, "personas": {}}
+        for persona, stats in self._stats.items():
+            turns = stats["turns"]
+            cache: Optional[caching.CachedContent] = self._caches.get(persona)
+            result["personas"][persona] = {
+                "builds": stats["builds"],
+                "build_ms": round(stats["build_ms"], 2),
+                "cached_content": cache.name if cache is not None else None,
+                "turns": turns,
+                "avg_setup_ms": round(stats["setup_ms"] / turns, 3) if turns else 0.0,
+                "prompt_tokens": stats["prompt_tokens"],
+                "cached_tokens": stats["cached_tokens"],
+                "output_tokens": stats["output_tokens"],
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / turns, 1) if turns else 0.0,
+            }
+        return result
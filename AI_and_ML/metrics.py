@@ -0,0 +1,270 @@
+"""
+Prometheus-style metrics in the text exposition format, served by GET /metrics (no client library needed).
+
+Every process keeps its own numbers: with several uvicorn workers, scrape each worker (or run one per target).
+Forecast fits in the worker pool send their stage timings back with the result (collect_stages /
+record_stages), so they are counted in the serving process.
+"""
+import os
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Adds a Server-Timing header (per-stage durations of the request) to every response
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "0") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cached embedding (~1 ms) to a cold Prophet fit or a long tool loop (tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY: List["Metric"] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Sequence[Tuple[str, Any]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """A named metric family; one series per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(list(zip(self.labelnames, key)))} {_number(value)}"
+
+
+class Gauge(Metric):
+    """A value that goes up and down; set_function() reads an unlabelled gauge at scrape time instead."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._function = fn
+
+    @contextmanager
+    def track_in_flight(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> Iterator[str]:
+        if self._function is not None:
+            yield f"{self.name} {_number(self._function())}"
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(list(zip(self.labelnames, key)))} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(pairs)} {_number(total)}"
+            yield f"{self.name}_count{_labels(pairs)} {count}"
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- Request stages ---
+# backend_fetch, dataframe_prep, fit, predict, format (forecasts); embed, vector_query, llm_turn (chat/RAG)
+
+STAGE_SECONDS = Histogram("ai_stage_seconds", "Time spent in each stage of a request.", ["stage"])
+
+HTTP_REQUESTS = Counter("ai_http_requests_total", "Requests handled, by route template and status.", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram("ai_http_request_seconds", "Request latency until the last body byte, by route template.", ["method", "route"])
+HTTP_IN_FLIGHT = Gauge("ai_http_requests_in_flight", "Requests currently being handled.")
+
+# Stage timings of the current request (for the Server-Timing header); None outside a request
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+# Inside collect_stages(): only collect, the caller records them in its own process
+_deferred: ContextVar[bool] = ContextVar("stage_timings_deferred", default=False)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+    if not _deferred.get():
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def record_stages(timings: Dict[str, float]) -> None:
+    for name, seconds in timings.items():
+        record_stage(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the block as one request stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def collect_stages(fn: Callable[..., Any], *args) -> Tuple[Any, Dict[str, float]]:
+    """
+    Runs fn(*args) in a worker process or thread and returns (result, stage timings), so the caller
+    can record_stages() them where /metrics is served. Module-level so the pool can pickle it.
+    """
+    timings_token = _timings.set({})
+    deferred_token = _deferred.set(True)
+    try:
+        return fn(*args), _timings.get()
+    finally:
+        _deferred.reset(deferred_token)
+        _timings.reset(timings_token)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """Server-Timing header value, in milliseconds (shown per request in the browser's network panel)."""
+    entries = [f"{name};dur={1000 * seconds:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request count and latency per route template, requests in flight, and the
+    optional Server-Timing header. Streamed responses send their headers before the work is done,
+    so their Server-Timing only covers the stages finished by then.
+    """
+
+    def __init__(self, app, timing_headers: bool = METRICS_TIMING_HEADERS):
+        self.app = app
+        self.timing_headers = timing_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.timing_headers:
+                    header = server_timing(timings, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            with HTTP_IN_FLIGHT.track_in_flight():
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            # Route templates (/chat/sessions/{session_id}) keep the label set small; 404s share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route)
@@ -0,0 +1,319 @@
+"""
+RAG router: vaccine ingestion into the vector index and the retrieval used by the chat tool.
+
+Also owns the shared Gemini plumbing (SDK configuration, the bounded pool for blocking SDK calls).
+Nothing here dials Gemini or Pinecone at import; startup() configures Gemini and opens the index.
+"""
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
+import google.generativeai as genai
+
+from embedding_cache import EmbeddingCache
+from semantic_cache import SemanticCache
+from vector_store import VECTOR_STORE, LOCAL_VECTOR_STORE_PATH, create_vector_store
+from metrics import stage
+from vaccine_ingest import (
+    INGEST_EMBED_BATCH_SIZE, INGEST_RECORDS_PER_GROUP, ChunkLedger, iter_jsonl, upsert_in_batches, vaccine_chunks
+)
+
+router = APIRouter()
+
+# --- 1. Configuration ---
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "vaccine-index-gemini")
+
+# The Gemini and Pinecone SDK calls are blocking. They run on this bounded pool so a slow LLM turn never
+# stalls the event loop.
+LLM_THREADS = int(os.getenv("LLM_THREADS", "64"))
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking SDK call on llm_executor (in the caller's context, so its stage timings reach the request)."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(llm_executor, call)
+
+_gemini_configured = False
+_index = None
+_index_lock = threading.Lock()
+
+def configure_gemini() -> None:
+    """Configures the Gemini SDK once; called from the chat/RAG startup hooks rather than at import."""
+    global _gemini_configured
+    if _gemini_configured:
+        return
+    if not GOOGLE_API_KEY:
+        raise ValueError("Missing GOOGLE_API_KEY.")
+    genai.configure(api_key=GOOGLE_API_KEY)
+    _gemini_configured = True
+
+def get_index():
+    """The vector index, opened on first use: Pinecone, or the local NumPy store with VECTOR_STORE=local."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if VECTOR_STORE == "pinecone" and not PINECONE_API_KEY:
+                    raise ValueError("Missing PINECONE_API_KEY (or set VECTOR_STORE=local).")
+                _index = create_vector_store(VECTOR_STORE, PINECONE_API_KEY, PINECONE_INDEX_NAME)
+    return _index
+
+# Hashes of the chunks last written to this index, so bulk re-ingestion skips unchanged vaccines
+chunk_ledger = ChunkLedger(f"{VECTOR_STORE}:{PINECONE_INDEX_NAME if VECTOR_STORE == 'pinecone' else LOCAL_VECTOR_STORE_PATH}")
+
+async def startup() -> None:
+    configure_gemini()
+    # Open the index now rather than on the first question. Missing keys fail the boot;
+    # an unreachable Pinecone is only logged and retried on first use.
+    try:
+        await asyncio.to_thread(get_index)
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Vector index unavailable at startup: {e}")
+
+async def shutdown() -> None:
+    llm_executor.shutdown(wait=False, cancel_futures=True)
+
+# --- 2. Data Models ---
+class VaccineStoreRequest(BaseModel):
+    vaccine_name: str = Field(..., example="BCG")
+    full_name: Optional[str] = Field(None, example="Bacille Calmette-Guérin")
+    category: str = Field(..., example="Government EPI (Mandatory)")
+    details: str = Field(..., example="BCG protects against tuberculosis...")
+    preservation_guidelines: str = Field(..., example="Store between +2°C and +8°C...")
+
+# --- 3. Helper Functions ---
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Local cache of Gemini embeddings: the same questions get embedded over and over
+embedding_cache = EmbeddingCache()
+
+# Recent formatted Pinecone results, matched by query-vector similarity (invalidated by /store-vaccine)
+retrieval_cache = SemanticCache()
+
+def embed_text(text: str, task_type: str) -> List[float]:
+    """Gemini embedding with the local cache in front; a repeat text skips the remote call."""
+    def call_gemini(content: str) -> List[float]:
+        with stage("embed"):
+            return genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=content,
+                task_type=task_type
+            )['embedding']
+
+    return embedding_cache.get_or_embed(EMBEDDING_MODEL, task_type, text, call_gemini)
+
+def get_gemini_embedding(text: str) -> List[float]:
+    """Generates 768-dimension vector using Gemini."""
+    return embed_text(text, "RETRIEVAL_DOCUMENT")
+
+def embed_texts(texts: List[str], task_type: str) -> List[List[float]]:
+    """Embeddings for many texts: cached ones locally, the rest in batched embed_content calls."""
+    def call_gemini(batch: List[str]) -> List[List[float]]:
+        with stage("embed"):
+            return genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=batch,
+                task_type=task_type
+            )['embedding']
+
+    return embedding_cache.get_or_embed_many(EMBEDDING_MODEL, task_type, texts, call_gemini, INGEST_EMBED_BATCH_SIZE)
+
+def embed_documents(texts: List[str]) -> List[List[float]]:
+    return embed_texts(texts, "RETRIEVAL_DOCUMENT")
+
+async def ingest_vaccines(group: List[tuple], force: bool = False) -> List[Dict[str, Any]]:
+    """
+    Embeds and upserts (position, VaccineStoreRequest) pairs and returns one status dict per record.
+    Chunks whose hash matches the ledger are skipped unless force is set.
+    """
+    # 1. Chunk; when a vaccine appears twice, the later record wins
+    latest = {data.vaccine_name.lower(): position for position, data in group}
+    results, pending = [], []
+    for position, data in group:
+        result = {"index": position, "vaccine_name": data.vaccine_name, "status": "stored", "stored_ids": [], "unchanged_ids": []}
+        results.append(result)
+        if latest[data.vaccine_name.lower()] != position:
+            result["status"] = "superseded"
+            continue
+        pending.append((result, vaccine_chunks(data)))
+
+    # 2. Skip chunks that are already in the index with the same text and metadata
+    all_chunks = [chunk for _, chunks in pending for chunk in chunks]
+    unchanged = set() if force else await asyncio.to_thread(chunk_ledger.unchanged, all_chunks)
+    to_write = [chunk for chunk in all_chunks if chunk["id"] not in unchanged]
+
+    # 3. Embed what changed in batched calls
+    try:
+        vectors = await run_blocking(embed_documents, [chunk["text"] for chunk in to_write])
+    except Exception as e:
+        print(f"Bulk Embedding Error: {e}")
+        for result, _ in pending:
+            result.update(status="failed", error=f"embedding failed: {e}")
+        return results
+
+    # 4. Upsert in sized batches, several at once
+    records = [
+        {"id": chunk["id"], "values": vector, "metadata": chunk["metadata"]}
+        for chunk, vector in zip(to_write, vectors)
+    ]
+    failed = {}
+    for batch, error in await upsert_in_batches(lambda batch: get_index().upsert(vectors=batch), records):
+        if error is not None:
+            print(f"Bulk Upsert Error: {error}")
+            failed.update((r["id"], str(error)) for r in batch)
+
+    # 5. Per-record status
+    written = []
+    for result, chunks in pending:
+        for chunk in chunks:
+            if chunk["id"] in unchanged:
+                result["unchanged_ids"].append(chunk["id"])
+            elif chunk["id"] in failed:
+                result.update(status="failed", error=failed[chunk["id"]])
+            else:
+                result["stored_ids"].append(chunk["id"])
+                written.append(chunk)
+        if result["stored_ids"]:
+            retrieval_cache.invalidate_vaccine(result["vaccine_name"])
+        elif result["status"] == "stored":
+            result["status"] = "unchanged"
+
+    await asyncio.to_thread(chunk_ledger.record, written)
+    return results
+
+def query_pinecone(query_text: str, top_k: int = 3) -> str:
+    """Encodes query and searches Pinecone."""
+    # 1. Embed query (specify task_type for better retrieval results)
+    query_vector = embed_text(query_text, "RETRIEVAL_QUERY")
+
+    # 2. Reuse the result of a recent, near-identical query if there is one
+    cached = retrieval_cache.lookup(query_vector, top_k, query_text)
+    if cached is not None:
+        return cached
+
+    # 3. Search
+    started = time.perf_counter()
+    with stage("vector_query"):
+        results = get_index().query(
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+
+    # 4. Format
+    if not results['matches']:
+        formatted = "No relevant vaccine information found in the database."
+    else:
+        formatted_hits = []
+        for match in results['matches']:
+            md = match['metadata']
+            formatted_hits.append(
+                 f"SOURCE (Vaccine: {md.get('vaccine_name')}, Topic: {md.get('topic')}):\n{md.get('text')}"
+            )
+        formatted = "\n\n---\n\n".join(formatted_hits)
+
+    retrieval_cache.add(
+        query_text,
+        query_vector,
+        top_k,
+        formatted,
+        vaccine_names=[match['metadata'].get('vaccine_name') for match in results['matches']],
+        miss_seconds=time.perf_counter() - started,
+    )
+    return formatted
+
+# --- 4. API Endpoints ---
+
+@router.get("/embedding_cache_stats")
+async def embedding_cache_stats():
+    """Memory/disk hit counters of the embedding cache and how many real embed calls were made."""
+    return await asyncio.to_thread(embedding_cache.stats)  # counts the SQLite rows
+
+
+@router.get("/retrieval_cache_stats")
+async def retrieval_cache_stats():
+    """Hit ratio of the semantic retrieval cache and the index.query latency it saved."""
+    return retrieval_cache.stats()
+
+@router.post("/store-vaccine")
+async def store_vaccine_data(data: VaccineStoreRequest):
+    """Stores vaccine data using Gemini Embeddings (768 dim)."""
+    try:
+        # Details + Preservation chunks, embedded in one batched call and always re-written
+        result = (await ingest_vaccines([(0, data)], force=True))[0]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result["status"] == "failed":
+        raise HTTPException(status_code=500, detail=result["error"])
+    return {"status": "success", "stored_ids": result["stored_ids"]}
+
+
+@router.post("/store-vaccines/bulk")
+async def store_vaccines_bulk(request: Request, force: bool = False):
+    """
+    Stores many vaccines in one request and reports a status per record
+    (stored / unchanged / superseded / invalid / failed).
+
+    Body: a JSON array of VaccineStoreRequest objects (or {"vaccines": [...]}), or JSONL with
+    Content-Type application/x-ndjson or application/jsonl, which is processed in groups of
+    INGEST_RECORDS_PER_GROUP records while the body is still streaming in.
+    ?force=true re-embeds and re-upserts chunks even if their text is unchanged.
+    """
+    results: List[Dict[str, Any]] = []
+    group: List[tuple] = []
+
+    def parse(position: int, raw) -> None:
+        try:
+            data = (
+                VaccineStoreRequest.model_validate_json(raw) if isinstance(raw, str)
+                else VaccineStoreRequest.model_validate(raw)
+            )
+            group.append((position, data))
+        except ValidationError as e:
+            results.append({"index": position, "status": "invalid", "error": str(e)})
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        position = 0
+        async for line in iter_jsonl(request.stream()):
+            parse(position, line)
+            position += 1
+            if len(group) >= INGEST_RECORDS_PER_GROUP:
+                results.extend(await ingest_vaccines(group, force))
+                group = []
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of vaccines or JSONL.")
+        items = body.get("vaccines") if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="Expected a list of vaccine records.")
+        for position, item in enumerate(items):
+            parse(position, item)
+
+    # The remaining records (all of them for a JSON array body)
+    if group:
+        results.extend(await ingest_vaccines(group, force))
+
+    results.sort(key=lambda r: r["index"])
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {
+        "status": "success" if not counts.get("failed") and not counts.get("invalid") else "partial",
+        "counts": counts,
+        "records": results,
+    }
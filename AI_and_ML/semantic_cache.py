@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Near-identical tool queries ("BCG storage" / "how to store BCG") map to nearly parallel embeddings
+RETRIEVAL_CACHE_THRESHOLD = float(os.getenv("RETRIEVAL_CACHE_THRESHOLD", "0.92"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "512"))
+
+
+class SemanticCache:
+    """
+    Caches formatted retrieval results by query vector.
+
+    Vectors are kept L2-normalised in a fixed-size matrix (ring buffer), so a lookup is one
+    matrix-vector product plus an argmax; a hit is the most similar live entry with cosine
+    similarity >= threshold, the same top_k and the same vaccines named in the query
+    ("BCG storage temperature" and "MR storage temperature" embed almost identically).
+    Vaccine names are learned from the results that get cached and from invalidate_vaccine.
+    """
+
+    def __init__(
+        self,
+        threshold: float = RETRIEVAL_CACHE_THRESHOLD,
+        ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+        max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim), allocated on first add
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._next = 0
+        self._known_vaccines: set = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._miss_seconds_total = 0.0
+        self._miss_samples = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _named_vaccines(self, query: str) -> frozenset:
+        """Known vaccine names that occur in the (casefolded) query as whole words."""
+        return frozenset(
+            name for name in self._known_vaccines
+            if re.search(rf"(?<!\w){re.escape(name)}(?!\w)", query)
+        )
+
+    def lookup(self, vector: List[float], top_k: int, query_text: str = "") -> Optional[str]:
+        with self._lock:
+            if self._matrix is None or not self._valid.any():
+                self.misses += 1
+                return None
+
+            live = self._valid & (time.time() - self._stored_at <= self.ttl_seconds)
+            sims = self._matrix @ self._unit(vector)
+            sims[~live] = -1.0
+            named = self._named_vaccines(query_text.casefold())
+            for idx in np.argsort(sims)[::-1]:
+                if sims[idx] < self.threshold:
+                    break
+                entry = self._entries[idx]
+                if entry["top_k"] == top_k and self._named_vaccines(entry["query"]) == named:
+                    self.hits += 1
+                    # A hit saves roughly what an average miss costs (index.query + formatting)
+                    if self._miss_samples:
+                        self.seconds_saved += self._miss_seconds_total / self._miss_samples
+                    return entry["result"]
+
+            self.misses += 1
+            return None
+
+    def add(
+        self,
+        query_text: str,
+        vector: List[float],
+        top_k: int,
+        result: str,
+        vaccine_names: Iterable[str],
+        miss_seconds: float = 0.0,
+    ) -> None:
+        unit = self._unit(vector)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, unit.shape[0]), dtype=np.float32)
+            idx = self._next
+            self._next = (self._next + 1) % self.max_entries  # overwrite the oldest slot when full
+
+            self._matrix[idx] = unit
+            self._valid[idx] = True
+            self._stored_at[idx] = time.time()
+            vaccines = {name.casefold() for name in vaccine_names if name}
+            self._known_vaccines |= vaccines
+            self._entries[idx] = {
+                "query": query_text.casefold(),
+                "top_k": top_k,
+                "result": result,
+                "vaccines": vaccines,
+            }
+            self._miss_seconds_total += miss_seconds
+            self._miss_samples += 1
+
+    def invalidate_vaccine(self, vaccine_name: str) -> int:
+        """
+        Drops entries that returned chunks of this vaccine, whose query names it, or that
+        returned nothing at all (any of those may now find the new chunks).
+        """
+        name = vaccine_name.casefold()
+        dropped = 0
+        with self._lock:
+            self._known_vaccines.add(name)
+            for idx, entry in enumerate(self._entries):
+                if entry is None or not self._valid[idx]:
+                    continue
+                if not entry["vaccines"] or name in entry["vaccines"] or name in self._named_vaccines(entry["query"]):
+                    self._valid[idx] = False
+                    self._entries[idx] = None
+                    dropped += 1
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._valid[:] = False
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(self._valid.sum()),
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "avg_miss_ms": round(1000 * self._miss_seconds_total / self._miss_samples, 2) if self._miss_samples else 0.0,
+                "latency_saved_ms": round(1000 * self.seconds_saved, 1),
+            }
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from cache_utils import LRUCache, SQLiteConnections
+
+# Server-side chat history for session mode: "memory" (per process) or "sqlite" (shared by the workers of a host)
+CHAT_SESSION_STORE = os.getenv("CHAT_SESSION_STORE", "memory").lower()
+CHAT_SESSION_PATH = os.getenv("CHAT_SESSION_PATH", "chat_sessions.sqlite3")
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "86400"))
+# Messages kept per session; the endpoints replay at most 5, so a little more than that is plenty
+CHAT_SESSION_WINDOW = int(os.getenv("CHAT_SESSION_WINDOW", "10"))
+
+Message = Dict[str, str]  # {"role": "user" | "model", "content": "..."}
+
+
+class SessionStore(ABC):
+    """Rolling window of recent messages per session id. None from get() means unknown or expired."""
+
+    def __init__(self, window: int = CHAT_SESSION_WINDOW):
+        self.window = window
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        self._save(session_id, [])
+        return session_id
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[List[Message]]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def _save(self, session_id: str, messages: List[Message]) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, object]:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """LRU of sessions with an idle TTL; the least recently used session is evicted first."""
+
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, ttl_seconds: float = CHAT_SESSION_TTL_SECONDS, window: int = CHAT_SESSION_WINDOW):
+        super().__init__(window)
+        self.sessions = LRUCache(max_entries=max_sessions, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[List[Message]]:
+        messages = self.sessions.get(session_id)
+        return list(messages) if messages is not None else None
+
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        with self._lock:  # read-modify-write, so two turns of one session don't drop each other's messages
+            current = self.sessions.get(session_id) or []
+            self._save(session_id, current + messages)
+
+    def delete(self, session_id: str) -> None:
+        self.sessions.pop(session_id)
+
+    def _save(self, session_id: str, messages: List[Message]) -> None:
+        self.sessions.set(session_id, messages[-self.window:])
+
+    def stats(self) -> Dict[str, object]:
+        stats = self.sessions.stats()
+        return {"store": "memory", "sessions": stats["entries"], "evictions": stats["evictions"], "window": self.window}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    messages TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite table; expired rows and the oldest beyond max_sessions are pruned as sessions are written."""
+
+    def __init__(
+        self,
+        path: str = CHAT_SESSION_PATH,
+        max_sessions: int = CHAT_SESSION_MAX,
+        ttl_seconds: float = CHAT_SESSION_TTL_SECONDS,
+        window: int = CHAT_SESSION_WINDOW,
+        prune_every: int = 100,
+    ):
+        super().__init__(window)
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.prune_every = prune_every
+        # Autocommit; append() runs its own BEGIN IMMEDIATE transaction
+        self._db = SQLiteConnections(path, _SCHEMA, isolation_level=None)
+        self._writes = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[List[Message]]:
+        row = self._db.connection().execute(
+            "SELECT messages FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl_seconds),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        conn = self._db.connection()
+        conn.execute("BEGIN IMMEDIATE")  # serialises concurrent appends to the same session across workers
+        try:
+            row = conn.execute("SELECT messages FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            current = json.loads(row[0]) if row else []
+            self._write(conn, session_id, current + messages)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_prune()
+
+    def delete(self, session_id: str) -> None:
+        self._db.connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _save(self, session_id: str, messages: List[Message]) -> None:
+        self._write(self._db.connection(), session_id, messages)
+        self._maybe_prune()
+
+    def _write(self, conn: sqlite3.Connection, session_id: str, messages: List[Message]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+            (session_id, json.dumps(messages[-self.window:], ensure_ascii=False), time.time()),
+        )
+
+    def _maybe_prune(self) -> None:
+        self._writes += 1
+        if self._writes % self.prune_every:
+            return
+        conn = self._db.connection()
+        expired = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        ).rowcount
+        self.evictions += expired + overflow
+
+    def stats(self) -> Dict[str, object]:
+        rows = self._db.connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"store": "sqlite", "sessions": rows, "evictions": self.evictions, "window": self.window}
+
+
+def create_session_store(backend: str = CHAT_SESSION_STORE) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown CHAT_SESSION_STORE '{backend}' (expected 'memory' or 'sqlite').")
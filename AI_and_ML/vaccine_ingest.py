@@ -0,0 +1,129 @@
+import os
+import time
+import json
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from cache_utils import SQLiteConnections
+
+# Gemini's batchEmbedContents takes at most 100 texts; Pinecone recommends upserts of ~100 vectors
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "100"))
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "100"))
+INGEST_UPSERT_CONCURRENCY = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "4"))
+# A streamed JSONL body is embedded/upserted in groups of this many records as it arrives
+INGEST_RECORDS_PER_GROUP = int(os.getenv("INGEST_RECORDS_PER_GROUP", "200"))
+VACCINE_CHUNK_LEDGER_PATH = os.getenv("VACCINE_CHUNK_LEDGER_PATH", "vaccine_chunks.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    store TEXT NOT NULL,
+    id TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vaccine_name TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (store, id)
+)
+"""
+
+
+def text_hash(text: str, metadata: Dict[str, Any]) -> str:
+    """Hash of everything that ends up in the index for a chunk (embedded text and metadata)."""
+    return hashlib.sha256(f"{text}\0{json.dumps(metadata, sort_keys=True)}".encode()).hexdigest()
+
+
+def vaccine_chunks(data) -> List[Dict[str, Any]]:
+    """
+    The two index chunks of a vaccine (details and preservation), as stored by /store-vaccine:
+    id, the text to embed, metadata, and the hash used to skip unchanged chunks.
+    """
+    chunks = []
+    for topic, body in (("Details", data.details), ("Preservation", data.preservation_guidelines)):
+        metadata = {
+            "vaccine_name": data.vaccine_name, "full_name": data.full_name or "",
+            "category": data.category, "topic": topic, "text": body
+        }
+        text = f"{data.vaccine_name} {topic}: {body}"
+        chunks.append({
+            "id": f"{data.vaccine_name.lower()}_{topic.lower()}",
+            "text": text,
+            "metadata": metadata,
+            "hash": text_hash(text, metadata),
+        })
+    return chunks
+
+
+class ChunkLedger:
+    """
+    Records the hash of every chunk last written to a vector store, so re-ingesting the catalog
+    only embeds and upserts what changed. Rows are scoped by store name (e.g. "pinecone:<index>").
+    """
+
+    def __init__(self, store: str, path: str = VACCINE_CHUNK_LEDGER_PATH):
+        self.store = store
+        self.path = path
+        self._db = SQLiteConnections(path, _SCHEMA)
+
+    def unchanged(self, chunks: Iterable[Dict[str, Any]]) -> Set[str]:
+        """Ids of the chunks whose stored hash matches."""
+        chunks = list(chunks)
+        stored = {}
+        conn = self._db.connection()
+        for start in range(0, len(chunks), 500):  # stay below SQLite's bound-parameter limit
+            ids = [c["id"] for c in chunks[start:start + 500]]
+            rows = conn.execute(
+                f"SELECT id, text_hash FROM chunks WHERE store = ? AND id IN ({','.join('?' * len(ids))})",
+                (self.store, *ids),
+            ).fetchall()
+            stored.update(rows)
+        return {c["id"] for c in chunks if stored.get(c["id"]) == c["hash"]}
+
+    def record(self, chunks: Iterable[Dict[str, Any]]) -> None:
+        now = time.time()
+        conn = self._db.connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+                [(self.store, c["id"], c["hash"], c["metadata"]["vaccine_name"], now) for c in chunks],
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._db.connection().execute("SELECT COUNT(*) FROM chunks WHERE store = ?", (self.store,)).fetchone()[0]
+        return {"store": self.store, "chunks": rows}
+
+
+async def upsert_in_batches(
+    upsert: Callable[[List[Dict[str, Any]]], Any],
+    vectors: List[Dict[str, Any]],
+    batch_size: int = INGEST_UPSERT_BATCH_SIZE,
+    concurrency: int = INGEST_UPSERT_CONCURRENCY,
+) -> List[Tuple[List[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Runs the (blocking) upsert on batches of vectors from a few threads at once.
+    Returns (batch, error) per batch; error is None when the batch was written.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(batch: List[Dict[str, Any]]):
+        async with limit:
+            try:
+                await asyncio.to_thread(upsert, batch)
+                return batch, None
+            except Exception as e:
+                return batch, e
+
+    batches = [vectors[i:i + batch_size] for i in range(0, len(vectors), batch_size)]
+    return await asyncio.gather(*[one(batch) for batch in batches])
+
+
+async def iter_jsonl(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Yields the non-empty lines of a streamed body as they arrive."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if buffer.strip():
+        yield buffer.decode("utf-8")
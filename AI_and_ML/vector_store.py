@@ -0,0 +1,182 @@
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker with VECTOR_STORE=local
+    fcntl = None
+
+# "pinecone" (default) or "local" (in-process NumPy index, works fully offline)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "vector_store")
+EMBEDDING_DIM = 768
+
+
+class VectorStore(ABC):
+    """
+    The slice of the Pinecone Index API the service uses. Implementations return query results
+    in Pinecone's shape ({"matches": [{"id", "score", "metadata"}]}) so call sites do not change.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def query(self, vector: List[float], top_k: int = 3, include_metadata: bool = True) -> Dict[str, Any]:
+        ...
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Normalised float32 vectors in a memory-mapped .npy matrix plus a JSON sidecar with ids and metadata.
+    Cosine top-k is a single matrix-vector product; the whole corpus here is two chunks per vaccine.
+
+    Safe with several uvicorn workers on one host: every call takes a flock on `<path>.lock`
+    (shared for queries, exclusive for upserts) and reloads the files when another process
+    has replaced the sidecar since this one last read or wrote it.
+    """
+
+    def __init__(self, path: str = LOCAL_VECTOR_STORE_PATH, dim: int = EMBEDDING_DIM):
+        self.matrix_path = f"{path}.npy"
+        self.meta_path = f"{path}.json"
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._lock_file = open(f"{path}.lock", "a") if fcntl is not None else None
+
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._positions: Dict[str, int] = {}
+        # (inode, mtime, size) of the sidecar we last loaded or wrote; os.replace gives every write a new inode
+        self._loaded_stamp: Optional[Tuple[int, int, int]] = None
+
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if self._lock_file is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _sidecar_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _sync(self) -> None:
+        """Reloads ids, metadata and the matrix if another process wrote them (caller holds both locks)."""
+        stamp = self._sidecar_stamp()
+        if stamp is None or stamp == self._loaded_stamp or not os.path.exists(self.matrix_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self._ids = meta["ids"]
+        self._metadata = meta["metadata"]
+        # Reopened every time: the matrix file may have been swapped for a bigger one by _ensure_capacity
+        self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+        self.dim = self._matrix.shape[1]
+        self._positions = {vec_id: i for i, vec_id in enumerate(self._ids)}
+        self._loaded_stamp = stamp
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _ensure_capacity(self, needed: int) -> None:
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(64, capacity * 2, needed)
+        tmp_path = f"{self.matrix_path}.tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+        if capacity:
+            grown[:capacity] = self._matrix
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def _persist(self) -> None:
+        self._matrix.flush()
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"ids": self._ids, "metadata": self._metadata}, f)
+        os.replace(tmp_path, self.meta_path)
+        self._loaded_stamp = self._sidecar_stamp()
+
+    def upsert(self, vectors: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Validate and normalise the whole batch first, so a bad record leaves the store untouched
+        rows = []
+        for record in vectors:
+            values = np.asarray(record["values"], dtype=np.float32)
+            if values.shape != (self.dim,):
+                raise ValueError(f"Vector {record['id']} has shape {values.shape}, expected ({self.dim},).")
+            norm = np.linalg.norm(values)
+            rows.append((record["id"], values / norm if norm else values, record.get("metadata") or {}))
+
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync()
+            new_ids = [vector_id for vector_id, _, _ in rows if vector_id not in self._positions]
+            self._ensure_capacity(len(self._ids) + len(set(new_ids)))
+
+            for vector_id, unit, metadata in rows:
+                pos = self._positions.get(vector_id)
+                if pos is None:
+                    pos = len(self._ids)
+                    self._ids.append(vector_id)
+                    self._metadata.append({})
+                    self._positions[vector_id] = pos
+                self._matrix[pos] = unit
+                self._metadata[pos] = metadata
+
+            self._persist()
+            return {"upserted_count": len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 3, include_metadata: bool = True) -> Dict[str, Any]:
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+            n = len(self._ids)
+            if n == 0:
+                return {"matches": []}
+            q = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(q)
+            scores = self._matrix[:n] @ (q / norm if norm else q)
+
+            k = min(top_k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return {
+                "matches": [
+                    {
+                        "id": self._ids[i],
+                        "score": float(scores[i]),
+                        "metadata": self._metadata[i] if include_metadata else {},
+                    }
+                    for i in top
+                ]
+            }
+
+
+def create_vector_store(backend: str = VECTOR_STORE, pinecone_api_key: Optional[str] = None, index_name: Optional[str] = None):
+    """Returns the configured store: a Pinecone Index (same upsert/query API) or a LocalVectorStore."""
+    if backend == "local":
+        return LocalVectorStore()
+    if backend == "pinecone":
+        from pinecone import Pinecone  # only needed when Pinecone is actually used
+        return Pinecone(api_key=pinecone_api_key).Index(index_name)
+    raise ValueError(f"Unknown VECTOR_STORE '{backend}' (expected 'pinecone' or 'local').")